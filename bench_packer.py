@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+"""
+packer 解包/打包基准测试
+
+按 Event.grp 的条目大小分布生成 1k/10k/100k 条目的合成封包，
+分别测量 unpack/pack 各模式的吞吐量(MB/s)、读写系统调用次数和峰值 RSS，
+结果写入 JSON 文件。每个用例在独立子进程中运行，保证峰值 RSS 互不影响；
+pack 用例的解包目录由父进程事先准备好，不计入用例的峰值 RSS。
+
+用法: python bench_packer.py [--counts 1000,10000,100000] [--output bench_results.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import packer
+
+SEED = 20260101
+REFERENCE_ARCHIVE = "Event.grp"
+
+# 用例名 -> 说明
+CASES = {
+    "unpack": "逐条目解包并打印",
+    "unpack_parallel": "线程池并发解包",
+    "pack": "缓冲读写打包",
+    "pack_zero_copy": "预分配 + copy_file_range/sendfile 打包",
+    # 条目在计时前读入内存，峰值 RSS 包含这些输入缓冲区，这是该接口本身的使用方式
+    "pack_entries": "从内存条目流式打包",
+}
+
+
+def reference_sizes() -> List[int]:
+    """取参考封包的条目大小作为分布样本，不存在时使用近似的对数正态分布"""
+    if os.path.isfile(REFERENCE_ARCHIVE):
+        with packer.GrpArchive(REFERENCE_ARCHIVE) as archive:
+            return [end - start for start, end in (archive.span(i) for i in range(len(archive)))]
+    rng = random.Random(SEED)
+    return [max(4, int(rng.lognormvariate(7.6, 0.8)) // 4 * 4) for _ in range(512)]
+
+
+def build_archive(path: str, count: int) -> int:
+    """按参考分布生成 count 个条目的合成封包，返回总字节数"""
+    rng = random.Random(SEED + count)
+    samples = reference_sizes()
+    sizes = [rng.choice(samples) for _ in range(count)]
+    offsets = packer.pack_entries(
+        ((str(i), rng.randbytes(s)) for i, s in enumerate(sizes)), path, count)
+    return offsets[-1]
+
+
+def io_counters() -> Optional[Dict[str, int]]:
+    """读取当前进程的读写系统调用次数（仅 Linux 的 /proc/self/io）"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return {"syscr": int(fields["syscr"]), "syscw": int(fields["syscw"])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def peak_rss_kb() -> Optional[int]:
+    """本进程的峰值 RSS(KB)。
+
+    Linux 上 ru_maxrss 会在 fork 时继承父进程的值并跨 exec 保留，
+    因此优先读取 /proc/self/status 中只属于当前地址空间的 VmHWM。
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run_case(case: str, archive: str, work_dir: str, fixture: str) -> Dict:
+    """在当前进程中运行一个用例，返回测量结果。fixture 为 pack 用例的输入目录（已解包）"""
+    unpacked = fixture if case.startswith("pack") else os.path.join(work_dir, "unpacked")
+    out_pak = os.path.join(work_dir, "out.pak")
+    entries = []
+    if case == "pack_entries":
+        for p in packer.collect_pack_files(unpacked):
+            with open(p, "rb") as f:
+                entries.append((os.path.basename(p), f.read()))
+
+    before = io_counters()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if case == "unpack":
+            packer.unpack(archive, unpacked)
+        elif case == "unpack_parallel":
+            packer.unpack_parallel([(archive, unpacked)])
+        elif case == "pack":
+            packer.pack(unpacked, out_pak)
+        elif case == "pack_zero_copy":
+            packer.pack(unpacked, out_pak, zero_copy=True)
+        elif case == "pack_entries":
+            packer.pack_entries(entries, out_pak)
+        else:
+            raise ValueError(f"未知用例: {case}")
+    elapsed = time.perf_counter() - t0
+    after = io_counters()
+
+    size = os.path.getsize(archive)
+    result = {
+        "case": case,
+        "seconds": elapsed,
+        "mb_per_s": size / (1 << 20) / elapsed if elapsed > 0 else None,
+        "peak_rss_kb": peak_rss_kb(),
+        "syscalls": None,
+    }
+    if before is not None and after is not None:
+        result["syscalls"] = {k: after[k] - before[k] for k in before}
+    if case.startswith("pack"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            same = packer.verify(out_pak, archive)
+        if not same:
+            raise RuntimeError(f"{case} 的输出与原封包不一致")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="packer 基准测试")
+    parser.add_argument("--counts", default="1000,10000,100000",
+                        help="合成封包的条目数，逗号分隔")
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help="要运行的用例，逗号分隔")
+    parser.add_argument("--output", default="bench_results.json",
+                        help="结果 JSON 文件")
+    parser.add_argument("--work-dir", default=None,
+                        help="工作目录（默认使用临时目录，可指定到网络盘上测试）")
+    # 内部使用：在子进程中运行单个用例
+    parser.add_argument("--run-case", nargs=4,
+                        metavar=("CASE", "ARCHIVE", "WORK_DIR", "FIXTURE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        case, archive, work_dir, fixture = args.run_case
+        json.dump(run_case(case, archive, work_dir, fixture), sys.stdout)
+        return
+
+    counts = [int(c) for c in args.counts.split(",") if c]
+    cases = [c for c in args.cases.split(",") if c]
+    root = args.work_dir or tempfile.mkdtemp(prefix="bench_packer_")
+    os.makedirs(root, exist_ok=True)
+
+    results = {
+        "seed": SEED,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "runs": [],
+    }
+    try:
+        for count in counts:
+            archive = os.path.join(root, f"Bench{count}.grp")
+            total = build_archive(archive, count)
+            print(f"生成合成封包: {archive} ({count} 个条目, {total} 字节)")
+            fixture = os.path.join(root, f"unpacked_{count}")
+            if any(case.startswith("pack") for case in cases):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    packer.unpack_parallel([(archive, fixture)])
+            for case in cases:
+                work_dir = os.path.join(root, f"{case}_{count}")
+                shutil.rmtree(work_dir, ignore_errors=True)
+                os.makedirs(work_dir)
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__),
+                     "--run-case", case, archive, work_dir, fixture],
+                    check=True, capture_output=True, text=True)
+                run = json.loads(proc.stdout.strip().splitlines()[-1])
+                run.update({"entries": count, "archive_bytes": total})
+                results["runs"].append(run)
+                print(
+                    f"  {case:<16} {run['seconds']:.3f}s  {run['mb_per_s']:.1f} MB/s  peak RSS {run['peak_rss_kb']} KB")
+                shutil.rmtree(work_dir, ignore_errors=True)
+            shutil.rmtree(fixture, ignore_errors=True)
+            os.remove(archive)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
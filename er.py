@@ -4,8 +4,9 @@ import os
 import json
 import argparse
 import re
-from typing import List, Dict, Optional, Tuple
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from utils_tools.libs import translate_lib
+from utils_tools.libs.ops_lib import OpStream, int_value, json_default, load_values
 
 
 names = dict()
@@ -32,14 +33,42 @@ def load_names(text: List[Dict[str, str]],
     return trans_index
 
 
-def extract_strings_from_file(file_path: str) -> List[Dict]:
+def iter_json_data(path: str, exclude: Iterable[str] = (), dump_dir: Optional[str] = None) -> Iterator[Tuple[str, str, Dict]]:
     """
-    扫描单文件，提取字符串。
+    遍历反汇编结果，返回 (路径, 相对路径, JSON字典)，其中 opcodes 为 OpStream。
+    path 为目录时读取其中的 JSON 文件；否则视为 grp 封包，在内存中直接反汇编，
+    此时只有指定了 dump_dir 才会把中间 JSON 写出（调试用），路径为写出的文件，否则为条目名。
+    """
+    if os.path.isdir(path):
+        for file in translate_lib.collect_files(path):
+            with open(file, 'r', encoding='utf-8') as f:
+                json_data = json.load(f)
+            json_data["opcodes"] = OpStream.from_opcodes(
+                load_values(json_data["opcodes"]), json_data["size"])
+            yield file, os.path.relpath(file, start=path), json_data
+        return
+
+    import ops
+    for name, json_data in ops.iter_disasm(path, exclude, stream=True):
+        rel_path = name + ".json"
+        if dump_dir:
+            out_file = os.path.join(dump_dir, rel_path)
+            os.makedirs(os.path.dirname(out_file), exist_ok=True)
+            with open(out_file, 'w', encoding='utf-8') as f:
+                json.dump(json_data, f, ensure_ascii=False,
+                          indent=2, default=json_default)
+            yield out_file, rel_path, json_data
+        else:
+            yield name, rel_path, json_data
+
+
+def extract_strings_from_data(file_path: str, json_data: Dict) -> List[Dict]:
+    """
+    从反汇编结果中提取字符串，file_path 仅用于标注来源。
     返回的 results: 每项至少包含 'message'；若该对话有角色名则包含 'name'。
+    json_data["opcodes"] 可以是列表、OpStream 或惰性的 OP 生成器，只遍历一次
     """
     results: List[Dict] = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        json_data = json.load(f)
 
     current_name = ""
     select_count = 0
@@ -48,7 +77,7 @@ def extract_strings_from_file(file_path: str) -> List[Dict]:
     for op in json_data["opcodes"]:
         if op["op"] == "47":
             assert select_count == 0
-            select_count, _ = translate_lib.de(op["value"][0])
+            select_count = int_value(op["value"][0])
 
         if op["op"] == "4A":
             current_name = op["value"][0]
@@ -86,11 +115,17 @@ def extract_strings_from_file(file_path: str) -> List[Dict]:
     return results
 
 
-def extract_strings(path: str, output_file: str):
-    files = translate_lib.collect_files(path)
+def extract_strings(path: str, output_file: str, exclude: Iterable[str] = (), dump_dir: Optional[str] = None):
     results = []
-    for file in files:
-        results.extend(extract_strings_from_file(file))
+    if os.path.isdir(path) or dump_dir:
+        for file, _, json_data in iter_json_data(path, exclude, dump_dir):
+            results.extend(extract_strings_from_data(file, json_data))
+    else:
+        # 封包输入且不需要中间 JSON 时，边解码边提取，不保留整个文件的 OP
+        import ops
+        for name, op_iter in ops.iter_disasm_ops(path, exclude):
+            results.extend(extract_strings_from_data(
+                name, {"opcodes": op_iter}))
 
     final_result = save_names()
     final_result.extend(results)
@@ -101,16 +136,13 @@ def extract_strings(path: str, output_file: str):
 # ========== 替换 ==========
 
 
-def replace_in_file(
-    file_path: str,
+def replace_in_data(
+    json_data: Dict,
+    rel: str,
     text: List[Dict[str, str]],
     output_dir: str,
-    trans_index: int,
-    base_root: str
+    trans_index: int
 ) -> int:
-    with open(file_path, 'r', encoding='utf-8') as f:
-        json_data = json.load(f)
-
     new_opcodes = []
 
     for op in json_data["opcodes"]:
@@ -134,26 +166,25 @@ def replace_in_file(
     json_data["opcodes"] = new_opcodes
 
     # ---------- 保存 ----------
-    rel = os.path.relpath(file_path, start=base_root)
     out_path = os.path.join(output_dir, rel)
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
     with open(out_path, 'w', encoding='utf-8') as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=2)
+        json.dump(json_data, f, ensure_ascii=False,
+                  indent=2, default=json_default)
 
     return trans_index
 
 
-def replace_strings(path: str, text_file: str, output_dir: str):
+def replace_strings(path: str, text_file: str, output_dir: str, exclude: Iterable[str] = (), dump_dir: Optional[str] = None):
     with open(text_file, 'r', encoding='utf-8') as f:
         text = json.load(f)
-    files = translate_lib.collect_files(path)
     trans_index = 0
     trans_index = load_names(text, trans_index)
 
-    for file in files:
-        trans_index = replace_in_file(
-            file, text, output_dir, trans_index, base_root=path)
+    for file, rel, json_data in iter_json_data(path, exclude, dump_dir):
+        trans_index = replace_in_data(
+            json_data, rel, text, output_dir, trans_index)
         print(f"已处理: {file}")
     if trans_index != len(text):
         print(f"错误: 有 {len(text)} 项译文，但只消耗了 {trans_index}。")
@@ -168,21 +199,30 @@ def main():
         dest='command', help='功能选择', required=True)
 
     ep = subparsers.add_parser('extract', help='解包文件提取文本')
-    ep.add_argument('--path', required=True, help='文件夹路径')
+    ep.add_argument('--path', required=True, help='文件夹路径或 grp 封包路径')
     ep.add_argument('--output', default='raw.json', help='输出JSON文件路径')
+    ep.add_argument('--exclude', action='append', default=[],
+                    help='封包模式下跳过的条目名，可重复指定')
+    ep.add_argument('--dump-dir', default=None,
+                    help='封包模式下把中间 JSON 写到该目录（调试用）')
 
     rp = subparsers.add_parser('replace', help='替换解包文件中的文本')
-    rp.add_argument('--path', required=True, help='文件夹路径')
+    rp.add_argument('--path', required=True, help='文件夹路径或 grp 封包路径')
+    rp.add_argument('--exclude', action='append', default=[],
+                    help='封包模式下跳过的条目名，可重复指定')
+    rp.add_argument('--dump-dir', default=None,
+                    help='封包模式下把中间 JSON 写到该目录（调试用）')
     rp.add_argument('--text', default='translated.json', help='译文JSON文件路径')
     rp.add_argument('--output-dir', default='translated',
                     help='输出目录(默认: translated)')
 
     args = parser.parse_args()
     if args.command == 'extract':
-        extract_strings(args.path, args.output)
+        extract_strings(args.path, args.output, args.exclude, args.dump_dir)
         print(f"提取完成! 结果保存到 {args.output}")
     elif args.command == 'replace':
-        replace_strings(args.path, args.text, args.output_dir)
+        replace_strings(args.path, args.text,
+                        args.output_dir, args.exclude, args.dump_dir)
         print(f"替换完成! 结果保存到 {args.output_dir} 目录")
 
 
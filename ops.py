@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 
+import hashlib
 import os
 import json
+import marshal
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict, List, Tuple
-from utils_tools.libs.ops_lib import Handler, assemble_one_op, byte_slice, flat, h, parse_data, string, u32, u16, u8, i16, i8
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from packer import GrpArchive, collect_pack_files, hash_bytes, iter_entries, load_manifest, manifest_path, order_pack_names, pack_entries
+from utils_tools.libs.ops_lib import CACHE_KEEP, Handler, OpStats, OpStream, byte_slice, compile_opcodes, flat, h, iter_ops, json_default, load_cached, load_values, parse_data, parse_stream, string, touch, u32, u16, u8, i16, i8
 from utils_tools.libs.translate_lib import collect_files, de, se
+from utils_tools.libs import ops_lib, translate_lib
 
 
 ascii_list: List[str] = []
@@ -14,23 +23,60 @@ hanzi_list: List[str] = []
 ascii_map = {}
 hanzi_map = {}
 
+# 单个全角字符或 "/E" 这类短控制码 -> 编码结果，由 encode_text 的逐对编码填充，码表变化时清空
+char_codes: Dict[str, bytes] = {}
 
-def read_from_system_file(path: str):
-    global ascii_list, ascii_map, hanzi_list, hanzi_map
-    chars = Path(path).read_bytes()
+# 已载入的 System002 内容的累计哈希，作为反汇编缓存键的一部分
+char_table_digest = ""
+
+
+def decode_system_file(chars: bytes) -> Tuple[List[str], List[str]]:
+    """把 System002 的内容按 2 字节一组解码为 (ascii 表, 汉字表)"""
     ascii_bytes = chars[:512]
-    for i in range(256):
-        v = ascii_bytes[i * 2:(i+1) * 2].decode("CP932")
-        ascii_list.append(v)
-        ascii_map[v] = i
+    ascii_part = [ascii_bytes[i * 2:(i+1) * 2].decode("CP932")
+                  for i in range(256)]
 
     hanzi_bytes = chars[512:]
     assert len(hanzi_bytes) % 2 == 0
 
-    for i in range(int(len(hanzi_bytes) / 2)):
-        v = hanzi_bytes[i * 2:(i+1) * 2].decode("CP932")
-        hanzi_list.append(v)
-        hanzi_map[v] = i
+    hanzi_part = [hanzi_bytes[i * 2:(i+1) * 2].decode("CP932")
+                  for i in range(int(len(hanzi_bytes) / 2))]
+    return ascii_part, hanzi_part
+
+
+def first_index(chars: List[str]) -> Dict[str, int]:
+    """字符 -> 第一次出现的下标"""
+    index: Dict[str, int] = {}
+    for i, v in enumerate(chars):
+        index.setdefault(v, i)
+    return index
+
+
+def reset_char_table():
+    global char_table_digest
+    del ascii_list[:], hanzi_list[:]
+    ascii_map.clear()
+    hanzi_map.clear()
+    char_codes.clear()
+    char_table_digest = ""
+
+
+def read_from_system_file(path: str):
+    global ascii_list, ascii_map, hanzi_list, hanzi_map, char_table_digest
+    char_codes.clear()
+    chars = Path(path).read_bytes()
+    char_table_digest = hashlib.blake2b(
+        char_table_digest.encode("ascii") + chars, digest_size=16).hexdigest()
+    # 解码结果按文件内容哈希缓存，码表不变时直接载入
+    ascii_part, hanzi_part = load_cached(
+        CACHE_DIR, "charmap", chars, lambda: decode_system_file(chars))
+
+    # 同一字符出现多次时以第一次的下标为准（原版码表中 "　" 同时位于 0x0B 和 0xE6，
+    # 游戏脚本使用的是 0x0B），这样用原版码表汇编可以逐字节还原
+    ascii_list.extend(ascii_part)
+    ascii_map.update(first_index(ascii_part))
+    hanzi_list.extend(hanzi_part)
+    hanzi_map.update(first_index(hanzi_part))
 
 
 def decode_text(data: bytes, offset: int) -> Tuple[List[str], int]:
@@ -59,36 +105,43 @@ def decode_text(data: bytes, offset: int) -> Tuple[List[str], int]:
 
 
 def encode_text(s: str) -> bytes:
-    out = bytearray()
-    i = 0
+    code = char_codes.get(s)
+    if code is not None:
+        return code
 
     s_bytes = s.encode("CP932")
 
     assert len(s_bytes) % 2 == 0
 
+    # 全是双字节字符时每个字符恰好对应一对字节，可以逐字符查表
+    single = len(s_bytes) == 2 * len(s)
+    if single:
+        try:
+            return b"".join([char_codes[c] for c in s])
+        except KeyError:
+            pass
+
+    out = bytearray()
     for i in range(int(len(s_bytes) / 2)):
         v = s_bytes[i * 2: (i+1) * 2].decode("CP932")
         if v in ascii_map:
-            out.append(ascii_map[v])
-            continue
-
-        if v in hanzi_map:
+            code = bytes((ascii_map[v],))
+        elif v in hanzi_map:
             v_i = hanzi_map[v]
             high = 0xFF - (v_i // 0x100)
             low = v_i % 0x100
-            out.append(high)
-            out.append(low)
-            continue
-
-        raise ValueError(f"未知的字符{v}")
-
+            code = bytes((high, low))
+        else:
+            raise ValueError(f"未知的字符{v}")
+        out += code
+        if single:
+            char_codes[s[i]] = code
+
+    if len(s) <= 2:
+        char_codes[s] = bytes(out)
     return bytes(out)
 
 
-def asm_one_op(op_entry: Dict) -> bytes:
-    return assemble_one_op(op_entry, str_encoding=encode_text)
-
-
 def i_str_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[List[str], int]:
     return decode_text(data, offset)
 
@@ -150,61 +203,584 @@ OPCODES_MAP = flat({
     h("4E"): [u8],
 })
 
+# 包含文本的 OP，翻译只会修改这些 OP
+TEXT_OPS = ("44", "4A")
+
+# 汇编时需要重定位的 OP: {op: 指向文件内 offset 的参数下标列表}
+# 目前的 OP 都不含文件内偏移：1A 的 u16 为目标文件索引，49 的 u16 为选项跳转目标（很小的序号），
+# 05/27 等的 u16 与 OP 起始位置的重合率只有随机水平。新发现跳转类 OP 时在这里登记即可。
+RELOCATIONS: Dict[str, List[int]] = {}
+
+# 生成的解码函数等缓存所在目录，相对本脚本而不是当前目录，import ops 时也会用到
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated", "cache")
+
+# 编译一次分派表和解码函数，避免每个文件都重新排序签名
+OPCODES = compile_opcodes(OPCODES_MAP, CACHE_DIR)
+
+# 不是脚本的条目（与 start.py 一致），verify-roundtrip 默认跳过
+NON_SCRIPT_ENTRIES = ("Event001",)
+
+# disasm 使用原始码表，asm/patch 使用替换后生成的码表
+SYSTEM_FILE = "system/System002"
+NEW_SYSTEM_FILE = "generated/misc/System002"
+
+
+def disasm_entry(file_name: str, data: bytes, stream: bool = False) -> Dict:
+    """
+    反汇编单个条目，返回与 JSON 文件同构的字典
+    stream 为 True 时 opcodes 为紧凑的 OpStream，适合需要同时持有大量文件的场合
+    """
+    json_data: dict = {"size": len(data)}
+
+    # 使用通用解析引擎和opcodes map
+    parse = parse_stream if stream else parse_data
+    json_data["opcodes"], offset = parse({
+        "file_name": file_name,
+        "offset": 0,
+    }, data, OPCODES)
+
+    assert offset == len(data)
+    return json_data
+
+
+# 反汇编结果缓存目录，按内容寻址。每组 (opcode 表, 处理器实现, 码表, 解释器版本) 一个子目录，
+# 其中 .json 为 disasm 写出的 JSON，.marshal 为 OpStream.to_state() 的结果（供 er.py 使用）
+DISASM_CACHE_DIR = os.path.join(CACHE_DIR, "disasm")
+
+_handlers_digest = None
+
+# 本进程中已更新过修改时间的缓存子目录
+_touched_generations = set()
+
+
+def handlers_digest() -> str:
+    """
+    本文件、ops_lib 和 translate_lib 源码的哈希：decode_text 等不透明处理器，
+    以及决定 JSON 内容的 json_default / Value.__str__ / se 的实现变化时缓存随之失效
+    """
+    global _handlers_digest
+    if _handlers_digest is None:
+        h = hashlib.blake2b(digest_size=16)
+        for path in (__file__, ops_lib.__file__, translate_lib.__file__):
+            h.update(Path(path).read_bytes())
+        _handlers_digest = h.hexdigest()
+    return _handlers_digest
+
+
+def disasm_cache_path(data: bytes, suffix: str) -> str:
+    """
+    子目录 = opcode 表指纹 + 处理器及 JSON 编码的实现 + 码表 + 解释器版本（marshal 格式随版本变化），
+    文件名 = 条目内容的哈希
+    """
+    generation = hashlib.blake2b(
+        f"{OPCODES.fingerprint}:{handlers_digest()}:{char_table_digest}:{sys.implementation.cache_tag}".encode("ascii"),
+        digest_size=8).hexdigest()
+    key = hashlib.blake2b(data, digest_size=20).hexdigest()
+    return os.path.join(DISASM_CACHE_DIR, generation, key[:2], key + suffix)
+
+
+def touch_generation(cache_path: str):
+    """每个进程对用到的缓存子目录更新一次修改时间，prune_disasm_cache 据此保留最近使用的子目录"""
+    generation_dir = os.path.dirname(os.path.dirname(cache_path))
+    if generation_dir not in _touched_generations:
+        _touched_generations.add(generation_dir)
+        touch(generation_dir)
+
+
+def prune_disasm_cache(keep: int = CACHE_KEEP):
+    """按修改时间只保留最近的 keep 个缓存子目录，其余的（opcode 表或码表变化前的结果）整个删除"""
+    try:
+        with os.scandir(DISASM_CACHE_DIR) as it:
+            dirs = [(entry.stat().st_mtime_ns, entry.path) for entry in it if entry.is_dir()]
+    except OSError:
+        return
+    dirs.sort(reverse=True)
+    for _, path in dirs[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def store_disasm_cache(cache_path: str, write: Callable[[str], None]):
+    """
+    由 write(临时文件路径) 写出缓存条目后原子替换，新建缓存子目录时清理旧的子目录。
+    写缓存只是尽力而为，失败时忽略
+    """
+    generation_dir = os.path.dirname(os.path.dirname(cache_path))
+    tmp = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        new = not os.path.isdir(generation_dir)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        write(tmp)
+        os.replace(tmp, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    touch_generation(cache_path)
+    if new:
+        prune_disasm_cache()
+
+
+def load_disasm_stream(cache_path: str) -> Optional[OpStream]:
+    """读取缓存的 OpStream，不存在或损坏时返回 None"""
+    try:
+        with open(cache_path, 'rb') as f:
+            stream = OpStream.from_state(marshal.load(f))
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    touch_generation(cache_path)
+    return stream
+
+
+def store_disasm_stream(cache_path: str, stream: OpStream):
+    def write(tmp: str):
+        with open(tmp, 'wb') as f:
+            marshal.dump(stream.to_state(), f)
+    store_disasm_cache(cache_path, write)
+
+
+def iter_disasm(input_path: str, exclude: Iterable[str] = (), stream: bool = False,
+                use_cache: bool = True) -> Iterator[Tuple[str, Dict]]:
+    """
+    逐个反汇编目录中的文件或 grp 封包中的条目，返回 (相对路径, JSON字典)
+    封包条目直接在内存中处理，不需要先解包到 asmed
+    use_cache 时解析结果以 OpStream 的形式按内容寻址缓存在 DISASM_CACHE_DIR 中
+    """
+    if not ascii_list:
+        read_from_system_file(SYSTEM_FILE)
+
+    for rel_path, data in iter_entries(input_path, exclude):
+        file_name = os.path.join(input_path, rel_path)
+        if not use_cache:
+            yield rel_path, disasm_entry(file_name, data, stream)
+            continue
 
-def disasm_mode(input_path: str, output_path: str):
-    """反汇编模式：将二进制文件转换为JSON"""
-    read_from_system_file("system/System002")
-    files = collect_files(input_path)
-
-    for file in files:
-        with open(file, "rb") as f:
-            data = f.read()
-
-        json_data: dict = {"size": len(data)}
-
-        # 使用通用解析引擎和opcodes map
-        json_data["opcodes"], offset = parse_data({
-            "file_name": file,
-            "offset": 0,
-        }, data, OPCODES_MAP)
-
-        assert offset == len(data)
-
-        # 保存为JSON
-        rel_path = os.path.relpath(file, start=input_path)
-        out_file = os.path.join(output_path, rel_path + ".json")
+        cache_path = disasm_cache_path(data, ".marshal")
+        opcodes = load_disasm_stream(cache_path)
+        if opcodes is None:
+            opcodes = disasm_entry(file_name, data, stream=True)["opcodes"]
+            store_disasm_stream(cache_path, opcodes)
+        yield rel_path, {"size": len(data), "opcodes": opcodes if stream else opcodes.to_opcodes()}
+
+
+def disasm_ops(file_name: str, data: bytes, cache_path: Optional[str] = None) -> Iterator[Dict]:
+    """
+    逐条产出单个条目的 OP，消费者可以提前停止；完整遍历时检查是否解析到了末尾
+    指定 cache_path 时同时记录为 OpStream，完整遍历后写入缓存
+    """
+    stream = OpStream(len(data)) if cache_path else None
+    ops = iter_ops(data, OPCODES, {
+        "file_name": file_name,
+        "offset": 0,
+    })
+    try:
+        while True:
+            op = next(ops)
+            if stream is not None:
+                stream.append(op["op"], op["offset"], op["value"])
+            yield op
+    except StopIteration as stop:
+        offset = stop.value
+    assert offset == len(data)
+    if stream is not None:
+        store_disasm_stream(cache_path, stream)  # type: ignore
+
+
+def iter_disasm_ops(input_path: str, exclude: Iterable[str] = (),
+                    use_cache: bool = True) -> Iterator[Tuple[str, Iterator]]:
+    """
+    与 iter_disasm 相同，但每个条目返回的是惰性的 OP 迭代器而不是完整的 JSON 字典
+    命中缓存时遍历缓存的 OpStream，否则边解码边产出，完整遍历后写入缓存
+    """
+    if not ascii_list:
+        read_from_system_file(SYSTEM_FILE)
+
+    for rel_path, data in iter_entries(input_path, exclude):
+        file_name = os.path.join(input_path, rel_path)
+        cache_path = disasm_cache_path(data, ".marshal") if use_cache else None
+        cached = load_disasm_stream(cache_path) if cache_path else None
+        yield rel_path, iter(cached) if cached is not None else disasm_ops(file_name, data, cache_path)
+
+
+def write_json(out_file: str, json_data: Dict):
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    with open(out_file, 'w', encoding='utf-8') as f:
+        json.dump(json_data, f, ensure_ascii=False,
+                  indent=2, default=json_default)
+
+
+def write_binary(out_file: str, blob: bytes):
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    with open(out_file, 'wb') as f:
+        f.write(blob)
+
+
+# ==========================================
+# 多进程
+# ==========================================
+
+# 工作进程中打开的原始条目（patch 模式）
+_worker_base: Optional['BaseEntries'] = None
+
+
+def init_worker(system_file: str, base_path: Optional[str], stats: bool):
+    """进程池的初始化函数：每个工作进程只载入一次码表和原始封包"""
+    global _worker_base
+    # fork 出的进程继承了父进程的码表，先清空以免重复追加
+    reset_char_table()
+    read_from_system_file(system_file)
+    _worker_base = BaseEntries(base_path) if base_path else None
+    OPCODES.stats = OpStats() if stats else None
+
+
+def call_job(func, args: Tuple) -> Tuple[Optional[str], object]:
+    """执行 func(*args)，返回 (错误信息, 结果)，异常不会中断其他任务"""
+    try:
+        return None, func(*args)
+    except Exception as e:
+        return f"{args[0]}: {type(e).__name__}: {e}", None
+
+
+def run_job(job: Tuple) -> Tuple[Optional[str], object, Optional[Dict]]:
+    """在工作进程中执行一个任务，返回 (错误信息, 结果, 本任务的统计)"""
+    error, result = call_job(*job)
+    records = None
+    if OPCODES.stats is not None:
+        records = OPCODES.stats.records
+        OPCODES.stats = OpStats()
+    return error, result, records
+
+
+def run_parallel(func, jobs_args: List[Tuple], jobs: int, system_file: str,
+                 base_path: Optional[str] = None) -> List:
+    """
+    用 jobs 个进程执行 func(*args)，结果按 jobs_args 的顺序返回；jobs <= 1 时在当前进程中依次执行。
+    所有任务结束后再汇总报告错误，有错误时退出码为 1。
+    """
+    global _worker_base
+    errors: List[str] = []
+    results: List = []
+    if jobs <= 1:
+        reset_char_table()
+        read_from_system_file(system_file)
+        with BaseEntries(base_path) if base_path else nullcontext() as base:
+            _worker_base = base
+            try:
+                for args in jobs_args:
+                    error, result = call_job(func, args)
+                    if error is not None:
+                        errors.append(error)
+                    results.append(result)
+            finally:
+                _worker_base = None
+    else:
+        chunksize = max(1, len(jobs_args) // (jobs * 4))
+        with ProcessPoolExecutor(jobs, initializer=init_worker,
+                                 initargs=(system_file, base_path, OPCODES.stats is not None)) as executor:
+            for error, result, records in executor.map(
+                    run_job, [(func, args) for args in jobs_args], chunksize=chunksize):
+                if records:
+                    part = OpStats()
+                    part.records = records
+                    OPCODES.stats.merge(part)  # type: ignore
+                if error is not None:
+                    errors.append(error)
+                results.append(result)
+
+    report_errors(errors)
+    return results
+
+
+def report_errors(errors: List[str]):
+    """打印所有错误，有错误时以退出码 1 结束"""
+    if errors:
+        for error in errors:
+            print(f"错误: {error}")
+        print(f"共 {len(errors)} 个文件处理失败")
+        sys.exit(1)
+
+
+def resolve_jobs(jobs: int) -> int:
+    """0 表示使用全部 CPU"""
+    return jobs if jobs > 0 else (os.cpu_count() or 1)
+
+
+# ==========================================
+# 各模式
+# ==========================================
+
+
+def disasm_job(file_name: str, data: bytes, out_file: str, use_cache: bool = True) -> bool:
+    """反汇编一个条目并写出 JSON，命中缓存时直接复制缓存文件，返回是否命中"""
+    cache_path = disasm_cache_path(data, ".json") if use_cache else None
+    if cache_path is not None and os.path.isfile(cache_path):
         os.makedirs(os.path.dirname(out_file), exist_ok=True)
-
-        with open(out_file, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2)
-
-
-def asm_mode(input_path: str, output_path: str):
-    """汇编模式：将JSON转换回二进制文件"""
-    read_from_system_file("generated/misc/System002")
+        shutil.copyfile(cache_path, out_file)
+        touch_generation(cache_path)
+        return True
+
+    write_json(out_file, disasm_entry(file_name, data))
+    if cache_path is not None:
+        store_disasm_cache(cache_path, lambda tmp: shutil.copyfile(out_file, tmp))
+    return False
+
+
+def disasm_mode(input_path: str, output_path: str, exclude: Iterable[str] = (), jobs: int = 1,
+                use_cache: bool = True):
+    """
+    反汇编模式：将二进制文件（目录或 grp 封包）转换为JSON
+    use_cache 时按内容寻址复用 DISASM_CACHE_DIR 中之前的结果，跳过解析和 JSON 编码
+    """
+    jobs_args = [(os.path.join(input_path, rel_path), bytes(data),
+                  os.path.join(output_path, rel_path + ".json"), use_cache)
+                 for rel_path, data in iter_entries(input_path, exclude)]
+    hits = run_parallel(disasm_job, jobs_args, jobs, SYSTEM_FILE)
+
+    if use_cache:
+        print(f"反汇编缓存: 命中 {sum(hits)} 个，解析 {len(hits) - sum(hits)} 个")
+
+
+def asm_file(file: str) -> bytearray:
+    """汇编单个 JSON 文件，返回按 4 字节对齐后的二进制"""
+    with open(file, 'r', encoding='utf-8') as f:
+        json_data = json.load(f)
+    load_values(json_data["opcodes"])
+
+    # 两遍汇编到一块预分配的缓冲区，按 RELOCATIONS 重定位文件内偏移，末尾按 4 字节对齐补 0
+    return OPCODES.assemble(json_data["opcodes"], encode_text, 4, RELOCATIONS, file, json_data["size"])
+
+
+def patch_file(file: str, data: bytes) -> bytes:
+    """
+    以原始条目 data 为底稿汇编单个 JSON 文件：只重新编码 TEXT_OPS，其余 OP 原样复制。
+    结果与 asm_file 相同（4 字节对齐），前提是非文本 OP 没有被修改。
+    """
+    with open(file, 'r', encoding='utf-8') as f:
+        json_data = json.load(f)
+
+    if json_data["size"] != len(data):
+        raise ValueError(f"{file}: 原始条目大小 {len(data)} 与记录的 {json_data['size']} 不一致")
+    return OPCODES.splice(data, json_data["opcodes"], TEXT_OPS, encode_text, 4, RELOCATIONS, file)
+
+
+class BaseEntries:
+    """按名字读取原始条目，base 为 grp 封包或解包后的目录"""
+
+    def __init__(self, base: str):
+        self.base = base
+        self.archive = None if os.path.isdir(base) else GrpArchive(base, strict=True)
+
+    def __enter__(self) -> 'BaseEntries':
+        return self
+
+    def __exit__(self, *exc):
+        if self.archive is not None:
+            self.archive.close()
+
+    def __getitem__(self, name: str):
+        if self.archive is not None:
+            return self.archive[name]
+        with open(os.path.join(self.base, name), 'rb') as f:
+            return f.read()
+
+
+def build_file(file: str, base: Optional[BaseEntries]) -> bytes:
+    """有 base 时走 patch_file，否则完整汇编"""
+    if base is None:
+        return asm_file(file)
+    name = os.path.basename(file)[:-5]
+    data = base[name]
+    try:
+        return patch_file(file, data)
+    finally:
+        if isinstance(data, memoryview):
+            data.release()
+
+
+def build_job(file: str, out_file: Optional[str]):
+    """工作进程中汇编一个文件：out_file 为 None 时返回结果，否则写到 out_file"""
+    blob = build_file(file, _worker_base)
+    if out_file is None:
+        return bytes(blob)
+    write_binary(out_file, blob)
+
+
+def build_key(base_path: Optional[str]) -> str:
+    """影响所有输出的输入：码表、opcode 表、处理器实现，patch 模式下还有原始封包"""
+    parts = [hash_bytes(Path(NEW_SYSTEM_FILE).read_bytes()),
+             OPCODES.fingerprint, handlers_digest(), json.dumps(RELOCATIONS, sort_keys=True)]
+    if base_path:
+        st = os.stat(base_path)
+        parts.append(f"{os.path.abspath(base_path)}:{st.st_size}:{st.st_mtime_ns}")
+    return hash_bytes("\n".join(parts).encode("utf-8"))
+
+
+def build_mode(input_path: str, output_path: str, base_path: Optional[str] = None, jobs: int = 1,
+               incremental: bool = False):
+    """
+    asm/patch 共用：把 input_path 中的 JSON 逐个汇编到 output_path
+    incremental 时在 output_path 旁的清单中记录每个输出对应的 JSON 哈希，
+    只重新汇编 JSON 或 build_key 变化、以及输出文件被改动过的文件
+    """
     files = collect_files(input_path, "json")
-
-    for file in files:
-        with open(file, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
-
-        new_blob = bytearray(b"".join([asm_one_op(op)
-                             for op in json_data["opcodes"]]))
-
-        # 计算对齐所需的填充长度
-        padding_size = (4 - (len(new_blob) % 4)) % 4
-
-        # 使用 extend 补 0
-        new_blob.extend(b'\x00' * padding_size)
-
-        # 保存二进制文件
-        rel_path = os.path.relpath(file, start=input_path)
-        rel_path = rel_path[:-5]  # 移除.json扩展名
-        out_file = os.path.join(output_path, rel_path)
-        os.makedirs(os.path.dirname(out_file), exist_ok=True)
-
-        with open(out_file, 'wb') as f:
-            f.write(new_blob)
+    # 移除.json扩展名
+    out_files = [os.path.join(output_path, os.path.relpath(file, start=input_path)[:-5])
+                 for file in files]
+
+    todo = list(zip(files, out_files))
+    if incremental:
+        manifest_file = manifest_path(os.path.normpath(output_path))
+        key = build_key(base_path)
+        old = load_manifest(manifest_file)
+        old_entries = old["entries"] if old and old.get("key") == key else {}
+        entries: Dict[str, Dict] = {}
+        todo = []
+        for file, out_file in zip(files, out_files):
+            rel = os.path.relpath(out_file, start=output_path)
+            with open(file, 'rb') as f:
+                input_hash = hash_bytes(f.read())
+            entry = old_entries.get(rel)
+            try:
+                st = os.stat(out_file)
+                fresh = entry is not None and entry["input"] == input_hash and \
+                    entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+            except OSError:
+                fresh = False
+            if fresh:
+                entries[rel] = entry
+            else:
+                entries[rel] = {"input": input_hash}
+                todo.append((file, out_file))
+
+    if todo:
+        run_parallel(build_job, todo, jobs, NEW_SYSTEM_FILE, base_path)
+
+    if incremental:
+        for file, out_file in todo:
+            st = os.stat(out_file)
+            entries[os.path.relpath(out_file, start=output_path)].update(
+                size=st.st_size, mtime_ns=st.st_mtime_ns)
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump({"key": key, "entries": entries}, f, ensure_ascii=False, indent=2)
+        print(f"增量汇编: 重新汇编 {len(todo)} 个，复用 {len(files) - len(todo)} 个")
+
+
+def asm_mode(input_path: str, output_path: str, jobs: int = 1, incremental: bool = False):
+    """汇编模式：将JSON转换回二进制文件"""
+    build_mode(input_path, output_path, None, jobs, incremental)
+
+
+def patch_mode(input_path: str, output_path: str, base_path: str, jobs: int = 1, incremental: bool = False):
+    """补丁模式：与 asm_mode 相同，但以原始封包/目录中的条目为底稿，只重新编码文本 OP"""
+    build_mode(input_path, output_path, base_path, jobs, incremental)
+
+
+def asm_pack_mode(input_path: str, output: str, pass_dirs: Iterable[str] = (),
+                  base_path: Optional[str] = None, jobs: int = 1):
+    """
+    汇编并直接打包：汇编结果不落盘，按条目顺序交给 packer.pack_entries
+    pass_dirs 中的文件（如 asmed_pass）原样加入封包
+    指定 base_path 时按补丁模式以原始条目为底稿，只重新编码文本 OP
+    """
+    # 名字 -> (文件路径, 是否需要汇编)
+    sources: Dict[str, Tuple[str, bool]] = {}
+    for file in collect_files(input_path, "json"):
+        sources[os.path.basename(file)[:-5]] = (file, True)
+    for pass_dir in pass_dirs:
+        for file in collect_pack_files(pass_dir):
+            sources[os.path.basename(file)] = (file, False)
+
+    ordered = order_pack_names(list(sources))
+
+    # 多进程时先按顺序汇编好全部条目，出错时不会写出不完整的封包
+    built: Dict[str, bytes] = {}
+    if jobs > 1:
+        names = [name for name in ordered if sources[name][1]]
+        blobs = run_parallel(build_job, [(sources[name][0], None) for name in names],
+                             jobs, NEW_SYSTEM_FILE, base_path)
+        built = dict(zip(names, blobs))
+    else:
+        read_from_system_file(NEW_SYSTEM_FILE)
+
+    errors: List[str] = []
+
+    def entries(base):
+        for name in ordered:
+            file, is_json = sources[name]
+            if name in built:
+                yield name, built.pop(name)
+            elif is_json:
+                # 出错的条目先占位，继续汇编其余条目以便一次报告全部错误
+                error, blob = call_job(build_file, (file, base))
+                if error is not None:
+                    errors.append(error)
+                yield name, blob if error is None else b''
+            else:
+                with open(file, 'rb') as f:
+                    yield name, f.read()
+        # 在 pack_entries 回填头部之前退出，临时文件被删除，原有封包保持不变
+        report_errors(errors)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with BaseEntries(base_path) if base_path and not built else nullcontext() as base:
+        offsets = pack_entries(entries(base), output, len(ordered))
+    print(f"已生成 {output}，包含 {len(ordered)} 个文件，总字节数 {offsets[-1]}。")
+
+
+def roundtrip_job(file_name: str, data: bytes) -> Tuple[int, float, Optional[int], Optional[str]]:
+    """
+    反汇编 -> JSON 文本 -> 汇编一个条目，与原始数据（按 4 字节对齐补 0）逐字节比较
+    返回 (字节数, 耗时秒, 第一个不一致的偏移, 错误信息)，一致时偏移和错误信息均为 None。
+    解析或汇编失败时不抛出，而是作为错误信息返回，由调用方记为不一致
+    """
+    t0 = time.perf_counter()
+    try:
+        text = json.dumps(disasm_entry(file_name, data), ensure_ascii=False, default=json_default)
+        opcodes = load_values(json.loads(text)["opcodes"])
+        blob = OPCODES.assemble(opcodes, encode_text, 4, RELOCATIONS, file_name, len(data))
+    except Exception as e:
+        return len(data), time.perf_counter() - t0, None, f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - t0
+
+    expected = bytes(data) + b"\0" * (-len(data) % 4)
+    if blob == expected:
+        return len(data), elapsed, None, None
+    mismatch = next((i for i, (a, b) in enumerate(zip(blob, expected)) if a != b),
+                    min(len(blob), len(expected)))
+    return len(data), elapsed, mismatch, None
+
+
+def verify_roundtrip_mode(input_path: str, exclude: Iterable[str] = (), jobs: int = 1) -> bool:
+    """
+    往返校验模式：用原版 SYSTEM_FILE 对每个条目做 反汇编 -> 汇编，要求结果与原始条目逐字节相同
+    NON_SCRIPT_ENTRIES 总是跳过。逐文件打印耗时和吞吐量，最后打印汇总，返回是否全部一致
+    """
+    exclude = set(exclude) | set(NON_SCRIPT_ENTRIES)
+    jobs_args = [(rel_path, bytes(data)) for rel_path, data in iter_entries(input_path, exclude)]
+    t0 = time.perf_counter()
+    results = run_parallel(roundtrip_job, jobs_args, jobs, SYSTEM_FILE)
+    wall = time.perf_counter() - t0
+
+    failed = 0
+    for (name, _), (size, elapsed, mismatch, error) in zip(jobs_args, results):
+        speed = size / (1 << 20) / elapsed if elapsed > 0 else 0.0
+        if error is not None:
+            failed += 1
+            status = f"FAIL {error}"
+        elif mismatch is not None:
+            failed += 1
+            status = f"FAIL @ 0x{mismatch:X}"
+        else:
+            status = "OK"
+        print(f"{name:<24} {size:>9} 字节 {elapsed * 1000:>8.2f} ms {speed:>8.2f} MB/s  {status}")
+
+    total = sum(size for size, _, _, _ in results)
+    cpu = sum(elapsed for _, elapsed, _, _ in results)
+    print(f"共 {len(results)} 个文件，{failed} 个不一致，总字节数 {total}")
+    print(f"墙钟 {wall:.3f}s ({total / (1 << 20) / wall if wall > 0 else 0.0:.2f} MB/s)，"
+          f"累计 {cpu:.3f}s，{jobs} 个进程")
+    return failed == 0
 
 
 def main():
@@ -212,18 +788,67 @@ def main():
 
     parser = argparse.ArgumentParser(description='游戏脚本反汇编/汇编工具')
     parser.add_argument(
-        'mode', choices=['disasm', 'asm'], help='模式: disasm(反汇编) 或 asm(汇编)')
-    parser.add_argument('input', help='输入文件夹路径')
-    parser.add_argument('output', help='输出文件夹路径')
+        'mode', choices=['disasm', 'asm', 'patch', 'verify-roundtrip'],
+        help='模式: disasm(反汇编)、asm(汇编)、patch(以原始条目为底稿只替换文本) 或 verify-roundtrip(逐字节往返校验)')
+    parser.add_argument('input', help='输入文件夹路径（disasm/verify-roundtrip 也可以是 grp 封包）')
+    parser.add_argument('output', nargs='?', default=None,
+                        help='输出文件夹路径（verify-roundtrip 不需要）')
+    parser.add_argument('--exclude', action='append', default=[],
+                        help='disasm/verify-roundtrip 时跳过的条目名，可重复指定（verify-roundtrip 总是跳过 Event001 等非脚本条目）')
+    parser.add_argument('--pack', action='store_true',
+                        help='asm 时把结果直接打包到 output 指定的封包文件，不写出中间目录')
+    parser.add_argument('--pass-dir', action='append', default=[],
+                        help='--pack 时原样加入封包的文件所在目录，可重复指定')
+    parser.add_argument('--base', default=None,
+                        help='patch 时原始条目所在的 grp 封包或目录')
+    parser.add_argument('--incremental', action='store_true',
+                        help='asm/patch 时只重新汇编输入有变化的文件（清单写在输出目录旁）')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='disasm 时不读写反汇编缓存')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='并行的进程数，0 表示使用全部 CPU（verify-roundtrip 默认全部 CPU，其余默认 1）')
+    parser.add_argument('--stats', action='store_true',
+                        help='结束时按 OP 打印次数、字节数和耗时统计表')
+    parser.add_argument('--stats-json', default=None,
+                        help='把按 OP 的统计写到该 JSON 文件')
 
     args = parser.parse_args()
-
-    if args.mode == 'disasm':
-        disasm_mode(args.input, args.output)
+    if args.mode != 'verify-roundtrip' and args.output is None:
+        parser.error(f"{args.mode} 模式需要 output")
+    if args.mode == 'patch' and not args.base:
+        parser.error("patch 模式需要 --base")
+    if args.stats or args.stats_json:
+        OPCODES.stats = OpStats()
+    if args.jobs is None:
+        args.jobs = 0 if args.mode == 'verify-roundtrip' else 1
+    jobs = resolve_jobs(args.jobs)
+
+    ok = True
+    if args.mode == 'verify-roundtrip':
+        ok = verify_roundtrip_mode(args.input, args.exclude, jobs)
+    elif args.mode == 'disasm':
+        disasm_mode(args.input, args.output, args.exclude,
+                    jobs, not args.no_cache)
         print(f"反汇编完成: {args.input} -> {args.output}")
+    elif args.mode in ('asm', 'patch') and args.pack:
+        asm_pack_mode(args.input, args.output, args.pass_dir,
+                      args.base if args.mode == 'patch' else None, jobs)
     elif args.mode == 'asm':
-        asm_mode(args.input, args.output)
+        asm_mode(args.input, args.output, jobs, args.incremental)
         print(f"汇编完成: {args.input} -> {args.output}")
+    elif args.mode == 'patch':
+        patch_mode(args.input, args.output, args.base,
+                   jobs, args.incremental)
+        print(f"补丁完成: {args.input} -> {args.output}")
+
+    if OPCODES.stats is not None:
+        if args.stats:
+            print("\n".join(OPCODES.stats.table()))
+        if args.stats_json:
+            OPCODES.stats.dump_json(args.stats_json)
+            print(f"统计已写入 {args.stats_json}")
+    if not ok:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
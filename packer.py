@@ -5,80 +5,363 @@ from pathlib import Path
 
 
 import argparse
+import hashlib
+import json
+import mmap
 import os
 import struct
 import sys
 import re
-from typing import List, Tuple
+import threading
+from array import array
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from utils_tools.libs.translate_lib import collect_files
 
 
-def read_offsets(fp) -> List[int]:
-    """从文件开头读取 u32 偏移值直到遇到 0。
+def parse_offsets(buf) -> List[int]:
+    """从内存中的封包数据一次性读取 u32 偏移表直到遇到 0（不含 0），返回偏移列表。
 
-    返回值为一个 int 列表，包含所有在 0 之前读取到的偏移值。
+    第一个偏移通常等于头部长度，据此一次性取出整张表并用 array.index 查找 0 终止；
+    不符合时按块扩大查找范围。
     """
-    offsets = []
-    idx = 0
+    n_words = len(buf) // 4
+    if n_words == 0:
+        raise EOFError("在读取偏移表时意外到达文件末尾")
+
+    first = struct.unpack_from('<I', buf, 0)[0]
+    chunk = first // 4 if 0 < first // 4 <= n_words else min(n_words, 4096)
     while True:
-        data = fp.read(4)
-        if len(data) < 4:
-            raise EOFError("在读取偏移表时意外到达文件末尾")
-        val = struct.unpack('<I', data)[0]
-        idx += 1
-        if val == 0:
-            break
-        offsets.append(val)
-    return offsets
+        words = array('I')
+        words.frombytes(buf[:chunk * 4])
+        if sys.byteorder == 'big':
+            words.byteswap()
+        try:
+            end = words.index(0)
+        except ValueError:
+            if chunk >= n_words:
+                raise EOFError("在读取偏移表时意外到达文件末尾")
+            chunk = min(n_words, chunk * 4)
+            continue
+        return words[:end].tolist()
+
+
+class HeaderReport:
+    """偏移表的结构校验结果，errors 为致命问题，warnings 为可继续处理的问题"""
+
+    def __init__(self, offsets: List[int], filesize: int):
+        self.offsets = offsets
+        self.filesize = filesize
+        self.header_end = 4 * (len(offsets) + 1)
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def lines(self) -> List[str]:
+        return [f"错误: {e}" for e in self.errors] + [f"警告: {w}" for w in self.warnings]
+
+
+def validate_offsets(offsets: List[int], filesize: int) -> HeaderReport:
+    """批量检查偏移表的单调性、越界和与头部的重叠，一次列出所有问题"""
+    report = HeaderReport(offsets, filesize)
+    header_end = report.header_end
+
+    if len(offsets) < 2:
+        report.errors.append("偏移表项不足，找不到可提取的文件。")
+        return report
+
+    # 根据题主描述，偏移表第一个值应该等于 header_end，作为简单校验
+    if offsets[0] != header_end:
+        report.warnings.append(
+            f"偏移表第一个值({offsets[0]}) != 偏移表结束后的第一个字节位置({header_end})。")
+
+    starts = offsets[:-1]
+    ends = offsets[1:]
+    for i in [i for i, (a, b) in enumerate(zip(starts, ends)) if b < a]:
+        report.errors.append(
+            f"第 {i+1} 个文件计算得到负大小 (start={starts[i]}, end={ends[i]})，与后续条目重叠。")
+    for i in [i for i, a in enumerate(starts) if a < header_end]:
+        report.errors.append(
+            f"第 {i+1} 个文件的起始偏移 {starts[i]} 落在偏移表内（头部长度 {header_end}）。")
+    for i in [i for i, a in enumerate(starts) if a > filesize]:
+        report.errors.append(
+            f"第 {i+1} 个文件的起始偏移 {starts[i]} 超过文件长度 {filesize}。")
+    for i in [i for i, b in enumerate(ends) if b > filesize]:
+        report.errors.append(
+            f"第 {i+1} 个文件的结束偏移 {ends[i]} 超过文件长度 {filesize}。")
+
+    if offsets[-1] < filesize:
+        report.warnings.append(
+            f"最后一个偏移 {offsets[-1]} 之后还有 {filesize - offsets[-1]} 字节未被任何条目引用。")
+    return report
+
+
+class GrpHeaderError(ValueError):
+    def __init__(self, path: str, report: HeaderReport):
+        self.report = report
+        super().__init__(
+            f"{path} 的偏移表有 {len(report.errors)} 个问题:\n" + "\n".join(report.lines()))
+
+
+class GrpArchive:
+    """以 mmap 方式只读打开 grp 封包（Event.grp/System.grp）。
+
+    打开时只解析并校验偏移表（结果在 report 中），之后可按索引（从 0 开始）
+    或名字（如 `Event123`）取得条目的零拷贝 memoryview 切片。
+    返回的切片在 close 之前必须全部释放。strict 为 True 时偏移表有错误直接抛出 GrpHeaderError。
+    """
+
+    def __init__(self, path: str, strict: bool = False):
+        self.path = path
+        self.base_name = os.path.splitext(os.path.basename(path))[0]
+        self._f = open(path, 'rb')
+        self.filesize = os.fstat(self._f.fileno()).st_size
+        if self.filesize > 0:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mm)
+        else:
+            # 空文件无法 mmap
+            self._mm = None
+            self._view = memoryview(b'')
+
+        try:
+            self.offsets = parse_offsets(self._view)
+        except Exception:
+            self.close()
+            raise
+        self.report = validate_offsets(self.offsets, self.filesize)
+        if strict and not self.report.ok:
+            self.close()
+            raise GrpHeaderError(path, self.report)
+        # 偏移表（含 0 终止）之后的第一个字节位置
+        self.header_end = self.report.header_end
+
+        n_files = max(len(self.offsets) - 1, 0)
+        self.pad_width = max(3, len(str(n_files)))
+        self._names = [self.name(i) for i in range(n_files)]
+        self._index = {name: i for i, name in enumerate(self._names)}
+
+    def __enter__(self) -> 'GrpArchive':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            self.close()
+        except BufferError:
+            # 异常发生时可能仍有未释放的切片，此时保留原异常，mmap 随切片一起被回收
+            if exc_type is None:
+                raise
+
+    def close(self) -> None:
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        try:
+            if self._mm is not None:
+                # 仍有未释放的切片时抛出 BufferError
+                self._mm.close()
+                self._mm = None
+        finally:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    def __getitem__(self, key: Union[int, str]) -> memoryview:
+        return self.entry(key)
+
+    def name(self, index: int) -> str:
+        """返回第 index 个条目的名字，与 unpack 写出的文件名一致"""
+        return f"{self.base_name}{str(index + 1).zfill(self.pad_width)}"
+
+    def names(self) -> List[str]:
+        return list(self._names)
+
+    def index_of(self, key: Union[int, str]) -> int:
+        if isinstance(key, str):
+            if key not in self._index:
+                raise KeyError(f"{self.path} 中不存在条目 {key}")
+            return self._index[key]
+        if key < 0:
+            key += len(self._names)
+        if not 0 <= key < len(self._names):
+            raise IndexError(f"{self.path} 的条目索引越界: {key}")
+        return key
+
+    def span(self, key: Union[int, str]) -> Tuple[int, int]:
+        """返回条目在封包中的 (start, end)，结束偏移超过文件长度时截断到文件末尾"""
+        i = self.index_of(key)
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        if start > self.filesize:
+            raise ValueError(
+                f"第 {i+1} 个文件的起始偏移 {start} 超过文件长度 {self.filesize}")
+        if end < start:
+            raise ValueError(
+                f"第 {i+1} 个文件计算得到负大小 (start={start}, end={end})")
+        return start, min(end, self.filesize)
+
+    def entry(self, key: Union[int, str]) -> memoryview:
+        """返回条目的零拷贝切片"""
+        if self._view is None:
+            raise ValueError(f"{self.path} 已关闭")
+        start, end = self.span(key)
+        return self._view[start:end]
+
+    def raw(self) -> memoryview:
+        """返回整个封包的零拷贝切片"""
+        if self._view is None:
+            raise ValueError(f"{self.path} 已关闭")
+        return self._view[:]
+
+    def items(self) -> Iterator[Tuple[str, memoryview]]:
+        for i, name in enumerate(self._names):
+            yield name, self.entry(i)
+
+
+def iter_entries(path: str, exclude: Iterable[str] = ()) -> Iterator[Tuple[str, bytes]]:
+    """虚拟文件系统：统一遍历目录中的文件或 grp 封包中的条目。
+
+    path 为目录时按自然顺序返回 (相对路径, 文件内容)；
+    否则视为 grp 封包，直接从内存返回 (条目名, 条目内容)，不落盘。
+    exclude 中的名字会被跳过。
+    """
+    exclude = set(exclude)
+    if os.path.isdir(path):
+        for file in collect_files(path):
+            rel_path = os.path.relpath(file, start=path)
+            if rel_path in exclude:
+                continue
+            with open(file, 'rb') as f:
+                yield rel_path, f.read()
+        return
+
+    with GrpArchive(path) as archive:
+        for i, name in enumerate(archive):
+            if name in exclude:
+                continue
+            view = archive.entry(i)
+            data = bytes(view)
+            view.release()
+            yield name, data
 
 
 def unpack(path: str, out_dir: str) -> None:
     os.makedirs(out_dir, exist_ok=True)
-    with open(path, 'rb') as f:
-        filesize = os.path.getsize(path)
-        # 读取偏移表直到 0
-        f.seek(0)
-        offsets = read_offsets(f)
-        # 读取完 0 后的当前位置（头部长度）
-        header_end = f.tell()
-
-        if len(offsets) < 2:
-            print("偏移表项不足，找不到可提取的文件。")
-            return
-
-        # 根据题主描述，偏移表第一个值应该等于 header_end，作为简单校验
-        if offsets[0] != header_end:
-            print(
-                f"警告: 偏移表第一个值({offsets[0]}) != 偏移表结束后的第一个字节位置({header_end})。继续按偏移表提取。")
+    with GrpArchive(path, strict=True) as archive:
+        for line in archive.report.lines():
+            print(line)
 
         # 按 offsets[i]..offsets[i+1] 提取，共 len(offsets)-1 个文件
-        n_files = len(offsets) - 1
-        base_name = os.path.splitext(os.path.basename(path))[0]
-        pad_width = max(3, len(str(n_files)))
+        n_files = len(archive)
 
         for i in range(n_files):
-            start = offsets[i]
-            end = offsets[i+1]
-            if start > filesize:
-                print(f"第 {i+1} 个文件的起始偏移 {start} 超过文件长度 {filesize}，跳过。")
-                continue
-            if end > filesize:
-                print(f"警告: 第 {i+1} 个文件的结束偏移 {end} 超过文件长度 {filesize}，截断到文件末尾。")
-                end = filesize
-            size = end - start
-            if size < 0:
-                print(f"警告: 第 {i+1} 个文件计算得到负大小 (start={start}, end={end})，跳过。")
-                continue
-            f.seek(start)
-            data = f.read(size)
-            out_name = f"{base_name}{str(i+1).zfill(pad_width)}"
-            out_path = os.path.join(out_dir, out_name)
-            with open(out_path, 'wb') as out_f:
-                out_f.write(data)
-            print(f"写出: {out_path} ({size} bytes)")
+            data = archive.entry(i)
+            try:
+                out_path = os.path.join(out_dir, archive.name(i))
+                with open(out_path, 'wb') as out_f:
+                    out_f.write(data)
+                print(f"写出: {out_path} ({len(data)} bytes)")
+            finally:
+                data.release()
 
         print(f"共提取 {n_files} 个文件到 {out_dir}")
 
 
+def check(path: str) -> bool:
+    """只解析并校验封包头部，列出所有问题"""
+    with GrpArchive(path) as archive:
+        report = archive.report
+    for line in report.lines():
+        print(line)
+    if report.ok:
+        print(f"{path}: 偏移表正常，共 {len(report.offsets) - 1} 个条目。")
+    return report.ok
+
+
+def unpack_parallel(jobs: List[Tuple[str, str]], workers: int = 8) -> None:
+    """同时解包多个封包，条目通过有界线程池并发写出，结束时只打印汇总。
+
+    适合网络挂载的工作目录，单个文件的写入延迟会被并发掩盖。
+    jobs 为 (封包路径, 输出目录) 列表。
+    """
+    t0 = time.perf_counter()
+    # 限制已提交但未完成的写入数量，避免一次性把所有条目塞进队列
+    slots = threading.BoundedSemaphore(max(1, workers) * 2)
+    lock = threading.Lock()
+    # 按任务下标统计，同一个封包解包到多个目录时各自计数
+    stats = [{"files": 0, "bytes": 0} for _ in jobs]
+    warnings: List[str] = []
+    errors: List[str] = []
+
+    def write_entry(job: int, out_path: str, view: memoryview) -> None:
+        try:
+            with open(out_path, 'wb') as out_f:
+                out_f.write(view)
+            with lock:
+                stats[job]["files"] += 1
+                stats[job]["bytes"] += len(view)
+        except OSError as e:
+            with lock:
+                errors.append(f"{out_path}: {e}")
+        except Exception as e:
+            # 线程池不会报告任务中的异常，全部记入 errors
+            with lock:
+                errors.append(f"{out_path}: {type(e).__name__}: {e}")
+        finally:
+            view.release()
+            slots.release()
+
+    archives = []
+    try:
+        for path, out_dir in jobs:
+            archives.append((GrpArchive(path, strict=True), out_dir))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for job, (archive, out_dir) in enumerate(archives):
+                warnings.extend(
+                    f"{archive.path}: {w}" for w in archive.report.warnings)
+                os.makedirs(out_dir, exist_ok=True)
+                for i in range(len(archive)):
+                    slots.acquire()
+                    view = archive.entry(i)
+                    try:
+                        pool.submit(write_entry, job,
+                                    os.path.join(out_dir, archive.name(i)), view)
+                    except BaseException:
+                        # 未能提交时 write_entry 不会执行，由这里释放
+                        view.release()
+                        slots.release()
+                        raise
+    finally:
+        for archive, _ in archives:
+            archive.close()
+
+    for w in warnings:
+        print(f"警告: {w}")
+    for e in errors:
+        print(f"错误: {e}")
+    elapsed = time.perf_counter() - t0
+    for (path, out_dir), st in zip(jobs, stats):
+        print(f"{path} -> {out_dir}: {st['files']} 个文件，{st['bytes']} 字节")
+    total_files = sum(st["files"] for st in stats)
+    print(f"共提取 {total_files} 个文件，用时 {elapsed:.3f}s")
+    if errors:
+        raise OSError(f"有 {len(errors)} 个文件写出失败")
+
+
 def extract_trailing_number(filename: str) -> Tuple[int, bool]:
     """尝试从 filename（不含扩展名）尾部提取连续数字，返回 (number, True) 或 (0, False)
     例如 'Event001' -> (1, True)
@@ -90,17 +373,8 @@ def extract_trailing_number(filename: str) -> Tuple[int, bool]:
     return (0, False)
 
 
-def pack(folder: str, output: str) -> None:
-    if not os.path.isdir(folder):
-        print(f"目录不存在: {folder}")
-        return
-    files = [f for f in os.listdir(
-        folder) if os.path.isfile(os.path.join(folder, f))]
-    if not files:
-        print("目录中没有可打包的文件。")
-        return
-
-    # 优先按文件名尾部数字排序
+def order_pack_names(files: List[str]) -> List[str]:
+    """返回打包顺序：优先按文件名尾部数字排序，没有数字的排在后面"""
     numbered = []
     unnumbered = []
     for fn in files:
@@ -111,19 +385,22 @@ def pack(folder: str, output: str) -> None:
             unnumbered.append(fn)
     if numbered:
         numbered.sort(key=lambda x: x[0])
-        ordered = [fn for _, fn in numbered] + sorted(unnumbered)
-    else:
-        ordered = sorted(files)
+        return [fn for _, fn in numbered] + sorted(unnumbered)
+    return sorted(files)
 
-    # 读取所有文件大小
-    sizes = []
-    paths = []
-    for fn in ordered:
-        p = os.path.join(folder, fn)
-        s = os.path.getsize(p)
-        sizes.append(s)
-        paths.append(p)
 
+def collect_pack_files(folder: str) -> List[str]:
+    """返回目录中待打包文件的路径，顺序见 order_pack_names"""
+    files = [f for f in os.listdir(
+        folder) if os.path.isfile(os.path.join(folder, f))]
+    return [os.path.join(folder, fn) for fn in order_pack_names(files)]
+
+
+def build_header(sizes: List[int]) -> Tuple[bytes, List[int]]:
+    """根据各条目大小计算偏移表，返回 (头部字节, 偏移列表)
+
+    偏移列表共 len(sizes)+1 项，最后一项为封包总长度。
+    """
     n_files = len(sizes)
     # header 中实际写入的偏移个数为 n_files+1（包含最后的总长度），外加一个 0 终止 -> 共 n_files+2 个 u32
     header_u32_count = n_files + 2
@@ -137,20 +414,626 @@ def pack(folder: str, output: str) -> None:
     # 最后一个偏移（总长度）
     offsets.append(cur)
 
+    header = struct.pack(f'<{len(offsets) + 1}I', *offsets, 0)
+    return header, offsets
+
+
+COPY_CHUNK_SIZE = 1 << 20
+
+
+def copy_range(in_f, out_f, src_offset: int, dst_offset: int, count: int, buf: bytearray) -> None:
+    """把 in_f 的 [src_offset, src_offset+count) 复制到 out_f 的 dst_offset 处。
+
+    优先使用 os.copy_file_range（内核内复制），其次 os.sendfile，
+    都不支持时退回到复用 buf 的分块缓冲复制。
+    """
+    in_fd = in_f.fileno()
+    out_fd = out_f.fileno()
+
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while count > 0:
+                n = os.copy_file_range(
+                    in_fd, out_fd, count, src_offset, dst_offset)
+                if n == 0:
+                    break
+                src_offset += n
+                dst_offset += n
+                count -= n
+            if count == 0:
+                return
+        except OSError:
+            # 跨文件系统等情况不支持，继续尝试其它方式
+            pass
+
+    if hasattr(os, 'sendfile'):
+        try:
+            # sendfile 写入 out_fd 的当前位置
+            os.lseek(out_fd, dst_offset, os.SEEK_SET)
+            while count > 0:
+                n = os.sendfile(out_fd, in_fd, src_offset, count)
+                if n == 0:
+                    break
+                src_offset += n
+                dst_offset += n
+                count -= n
+            if count == 0:
+                return
+        except OSError:
+            pass
+
+    view = memoryview(buf)
+    in_f.seek(src_offset)
+    out_f.seek(dst_offset)
+    while count > 0:
+        n = in_f.readinto(view[:min(count, len(view))])
+        if not n:
+            raise EOFError(f"复制时源文件意外结束，还剩 {count} 字节")
+        out_f.write(view[:n])
+        count -= n
+    out_f.flush()
+    view.release()
+
+
+def preallocate(out_f, size: int) -> None:
+    """把输出文件预分配到最终大小"""
+    out_f.truncate(size)
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(out_f.fileno(), 0, size)
+        except OSError:
+            pass
+
+
+def pack(folder: str, output: str, zero_copy: bool = False) -> None:
+    if not os.path.isdir(folder):
+        print(f"目录不存在: {folder}")
+        return
+    paths = collect_pack_files(folder)
+    if not paths:
+        print("目录中没有可打包的文件。")
+        return
+
+    # 读取所有文件大小
+    sizes = [os.path.getsize(p) for p in paths]
+    n_files = len(sizes)
+    header, offsets = build_header(sizes)
+    cur = offsets[-1]
+
     # 写入文件
     with open(output, 'wb') as out_f:
-        # 写偏移表
-        for v in offsets:
-            out_f.write(struct.pack('<I', v))
-        # 写 0 终止
-        out_f.write(struct.pack('<I', 0))
-        # 写入每个文件内容
-        for p in paths:
+        if zero_copy:
+            # 先算好头部并预分配最终大小，再把每个条目直接复制到其偏移处
+            preallocate(out_f, cur)
+            out_f.write(header)
+            out_f.flush()
+            buf = bytearray(COPY_CHUNK_SIZE)
+            for p, s, off in zip(paths, sizes, offsets):
+                with open(p, 'rb') as in_f:
+                    copy_range(in_f, out_f, 0, off, s, buf)
+        else:
+            # 写偏移表和 0 终止
+            out_f.write(header)
+            # 写入每个文件内容
+            for p in paths:
+                with open(p, 'rb') as in_f:
+                    data = in_f.read()
+                    out_f.write(data)
+
+    print(f"已生成 {output}，包含 {n_files} 个文件，总字节数 {cur}（不含额外元数据）。")
+
+
+def pack_entries(entries: Iterable[Tuple[str, Union[bytes, bytearray, memoryview]]], out, count: Optional[int] = None) -> List[int]:
+    """把内存中的 (名字, 数据) 流式打包，out 为输出路径或可 seek 的二进制文件对象（从开头写入）。
+
+    头部大小只取决于条目数，因此条目到达时即可确定偏移并写出，最后再回填偏移表。
+    count 为 None 时使用 len(entries)，不支持 len 的可迭代对象会先收集条目引用。
+    out 为路径时先写到 `out.tmp`，全部成功后才替换 out，中途出错时原有文件保持不变。
+    返回偏移列表（最后一项为总长度）。
+    """
+    if count is None:
+        if not hasattr(entries, '__len__'):
+            entries = list(entries)
+        count = len(entries)  # type: ignore
+
+    if isinstance(out, (str, os.PathLike)):
+        tmp = os.fspath(out) + '.tmp'
+        try:
+            with open(tmp, 'wb') as out_f:
+                offsets = pack_entries(entries, out_f, count)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.replace(tmp, out)
+        return offsets
+
+    header_size = 4 * (count + 2)
+    offsets = []
+    cur = header_size
+    out.seek(header_size)
+    for name, data in entries:
+        if len(offsets) >= count:
+            raise ValueError(f"条目数超过声明的 {count} 个: {name}")
+        offsets.append(cur)
+        out.write(data)
+        cur += memoryview(data).nbytes
+    if len(offsets) != count:
+        raise ValueError(f"声明了 {count} 个条目，实际只有 {len(offsets)} 个")
+    offsets.append(cur)
+
+    # 回填偏移表和 0 终止
+    out.seek(0)
+    out.write(struct.pack(f'<{count + 2}I', *offsets, 0))
+    out.seek(cur)
+    return offsets
+
+
+# packer manifest 生成的条目清单（条目按封包内的名字命名）
+MANIFEST_SUFFIX = '.manifest.json'
+# pack --incremental 使用的清单（条目按源文件命名，额外记录源文件 mtime），与上面的清单互不覆盖
+INCREMENTAL_SUFFIX = '.incremental.json'
+
+
+def hash_bytes(data) -> str:
+    """条目内容的快速哈希（blake2b-128）"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def manifest_path(archive_path: str) -> str:
+    return archive_path + MANIFEST_SUFFIX
+
+
+def incremental_manifest_path(archive_path: str) -> str:
+    return archive_path + INCREMENTAL_SUFFIX
+
+
+def load_manifest(path: str) -> Optional[Dict]:
+    """读取清单，不存在或损坏时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or 'entries' not in manifest:
+        return None
+    return manifest
+
+
+def save_manifest(archive_path: str, entries: List[Dict], path: Optional[str] = None) -> None:
+    """把条目清单写到 path（默认为封包旁），同时记录封包当前的大小和 mtime 用于判断清单是否过期"""
+    st = os.stat(archive_path)
+    with open(path or manifest_path(archive_path), 'w', encoding='utf-8') as f:
+        json.dump({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "entries": entries},
+                  f, ensure_ascii=False, indent=2)
+
+
+def archive_entries(archive: 'GrpArchive', use_sidecar: bool = True) -> List[Dict]:
+    """返回封包的条目清单（index/name/offset/size/hash）。
+
+    use_sidecar 为 True 且封包旁的清单与封包的大小、mtime、偏移表都一致时直接复用，
+    否则逐个条目计算哈希。
+    """
+    if use_sidecar:
+        manifest = load_manifest(manifest_path(archive.path))
+        if manifest is not None and manifest_matches(manifest, archive):
+            return manifest['entries']
+
+    entries = []
+    for i, name in enumerate(archive):
+        start, end = archive.span(i)
+        view = archive.entry(i)
+        try:
+            digest = hash_bytes(view)
+        finally:
+            view.release()
+        entries.append({
+            "name": name,
+            "index": i,
+            "offset": start,
+            "size": end - start,
+            "hash": digest,
+        })
+    return entries
+
+
+def manifest_matches(manifest: Dict, archive: 'GrpArchive') -> bool:
+    st = os.stat(archive.path)
+    if manifest.get('size') != st.st_size or manifest.get('mtime_ns') != st.st_mtime_ns:
+        return False
+    entries = manifest['entries']
+    if len(entries) != len(archive):
+        return False
+    for i, e in enumerate(entries):
+        start, end = archive.span(i)
+        if e.get('offset') != start or e.get('size') != end - start or 'hash' not in e:
+            return False
+    return True
+
+
+def manifest_is_current(manifest: Dict, archive_path: str) -> bool:
+    """磁盘上的封包是否仍是清单所描述的那个（大小、mtime、偏移表都一致）"""
+    if not os.path.isfile(archive_path):
+        return False
+    try:
+        with GrpArchive(archive_path, strict=True) as archive:
+            return manifest_matches(manifest, archive)
+    except (OSError, ValueError):
+        return False
+
+
+def write_manifest(path: str) -> None:
+    with GrpArchive(path) as archive:
+        entries = archive_entries(archive, use_sidecar=False)
+    save_manifest(path, entries)
+    print(f"已生成 {manifest_path(path)}，包含 {len(entries)} 个条目。")
+
+
+def source_entries(path: str) -> List[Dict]:
+    """返回 source 的条目清单：目录按打包顺序哈希每个文件，否则视为 grp 封包"""
+    if not os.path.isdir(path):
+        with GrpArchive(path) as archive:
+            return archive_entries(archive)
+
+    entries = []
+    for i, p in enumerate(collect_pack_files(path)):
+        with open(p, 'rb') as f:
+            data = f.read()
+        entries.append({
+            "name": os.path.basename(p),
+            "index": i,
+            "size": len(data),
+            "hash": hash_bytes(data),
+        })
+    return entries
+
+
+def diff_entries(a: List[Dict], b: List[Dict]) -> List[Tuple[int, Optional[Dict], Optional[Dict]]]:
+    """按索引逐个比较两份清单，哈希相同的条目直接跳过，返回 (index, a条目, b条目) 列表"""
+    result = []
+    for i in range(max(len(a), len(b))):
+        ea = a[i] if i < len(a) else None
+        eb = b[i] if i < len(b) else None
+        if ea is not None and eb is not None and ea['size'] == eb['size'] and ea['hash'] == eb['hash']:
+            continue
+        result.append((i, ea, eb))
+    return result
+
+
+def print_diff(diffs: List[Tuple[int, Optional[Dict], Optional[Dict]]]) -> None:
+    for i, ea, eb in diffs:
+        if ea is None:
+            print(f"+ #{i} {eb['name']} ({eb['size']} bytes)")
+        elif eb is None:
+            print(f"- #{i} {ea['name']} ({ea['size']} bytes)")
+        else:
+            print(
+                f"~ #{i} {ea['name']} -> {eb['name']} ({ea['size']} -> {eb['size']} bytes)")
+
+
+def verify(path: str, source: str) -> bool:
+    """校验封包内容是否与 source（目录或另一个封包）逐条目一致，封包本身总是重新计算哈希"""
+    with GrpArchive(path) as archive:
+        entries = archive_entries(archive, use_sidecar=False)
+    diffs = diff_entries(entries, source_entries(source))
+    print_diff(diffs)
+    if diffs:
+        print(f"校验失败: {path} 与 {source} 有 {len(diffs)} 个条目不一致。")
+        return False
+    print(f"校验通过: {path} 与 {source} 的 {len(entries)} 个条目一致。")
+    return True
+
+
+def diff(path_a: str, path_b: str) -> int:
+    """比较两个封包，优先使用未过期的清单，返回不一致条目数"""
+    with GrpArchive(path_a) as a, GrpArchive(path_b) as b:
+        diffs = diff_entries(archive_entries(a), archive_entries(b))
+        same = max(len(a), len(b)) - len(diffs)
+    print_diff(diffs)
+    print(f"共 {len(diffs)} 个条目不同，{same} 个条目相同。")
+    return len(diffs)
+
+
+def pack_incremental(folder: str, output: str, manifest_file: Optional[str] = None) -> None:
+    """增量打包：根据上一次生成的封包及其清单，只重新读取内容有变化的条目。
+
+    清单中记录每个条目的大小、mtime 和哈希，大小与 mtime 都未变的条目视为未变；
+    未变条目直接从旧封包复制。所有条目大小不变时直接原地修补旧封包。
+    旧封包的大小、mtime 或偏移表与清单不符（例如之后被完整打包覆盖过）时退回完整打包。
+    清单默认写在封包旁，输出目录需要原样发布时可用 manifest_file 放到别处。
+    """
+    if not os.path.isdir(folder):
+        print(f"目录不存在: {folder}")
+        return
+    paths = collect_pack_files(folder)
+    if not paths:
+        print("目录中没有可打包的文件。")
+        return
+
+    manifest_file = manifest_file or incremental_manifest_path(output)
+    old = load_manifest(manifest_file)
+    os.makedirs(os.path.dirname(manifest_file) or ".", exist_ok=True)
+    if old is not None and not manifest_is_current(old, output):
+        print("旧封包与清单不一致，执行完整打包。")
+        old = None
+    if old is None:
+        pack(folder, output, zero_copy=True)
+        old_entries = {}
+    else:
+        old_entries = {e['name']: e for e in old['entries']}
+
+    stats = [os.stat(p) for p in paths]
+    sizes = [st.st_size for st in stats]
+    header, offsets = build_header(sizes)
+    total = offsets[-1]
+
+    entries = []
+    changed = []
+    for i, (p, st) in enumerate(zip(paths, stats)):
+        name = os.path.basename(p)
+        prev = old_entries.get(name)
+        entry = {
+            "name": name,
+            "index": i,
+            "offset": offsets[i],
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+        if prev is not None and prev['size'] == st.st_size and prev.get('mtime_ns') == st.st_mtime_ns:
+            entry['hash'] = prev['hash']
+        else:
             with open(p, 'rb') as in_f:
                 data = in_f.read()
+            entry['hash'] = hash_bytes(data)
+            if prev is None or prev['hash'] != entry['hash']:
+                changed.append((i, data))
+        entries.append(entry)
+
+    if old is None:
+        # 刚刚做过完整打包，只需补写清单
+        save_manifest(output, entries, manifest_file)
+        return
+
+    in_place = len(entries) == len(old['entries']) and all(
+        e['name'] == o['name'] and e['size'] == o['size']
+        for e, o in zip(entries, old['entries']))
+
+    if in_place:
+        # 布局完全不变，原地覆盖变化的条目
+        with open(output, 'r+b') as out_f:
+            for i, data in changed:
+                out_f.seek(offsets[i])
                 out_f.write(data)
+        save_manifest(output, entries, manifest_file)
+        print(f"已原地更新 {output}，修改 {len(changed)} 个条目，复用 {len(entries) - len(changed)} 个条目。")
+        return
+
+    changed_data = dict(changed)
+    tmp = output + '.tmp'
+    buf = bytearray(COPY_CHUNK_SIZE)
+    with open(output, 'rb') as old_f, open(tmp, 'wb') as out_f:
+        preallocate(out_f, total)
+        out_f.write(header)
+        out_f.flush()
+        for i, entry in enumerate(entries):
+            if i in changed_data:
+                out_f.seek(offsets[i])
+                out_f.write(changed_data[i])
+                out_f.flush()
+            else:
+                prev = old_entries[entry['name']]
+                copy_range(old_f, out_f, prev['offset'],
+                           offsets[i], entry['size'], buf)
+    os.replace(tmp, output)
+    save_manifest(output, entries, manifest_file)
+    print(f"已生成 {output}，重新写入 {len(changed)} 个条目，从旧封包复用 {len(entries) - len(changed)} 个条目。")
+
+
+DELTA_MAGIC = b'GRPD'
+DELTA_VERSION = 1
+DELTA_BLOCK_SIZE = 16
+
+DELTA_ENTRY_SAME = 0
+DELTA_ENTRY_PATCH = 1
+DELTA_OP_COPY = 0
+DELTA_OP_INSERT = 1
+
+
+def write_varint(out: bytearray, v: int) -> None:
+    while v >= 0x80:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+
+def read_varint(buf, pos: int) -> Tuple[int, int]:
+    v = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        v |= (b & 0x7F) << shift
+        if b < 0x80:
+            return v, pos
+        shift += 7
+
+
+def weak_checksum(block) -> Tuple[int, int]:
+    """rsync 式弱校验和的 (a, b) 两个分量"""
+    n = len(block)
+    a = 0
+    b = 0
+    for k, x in enumerate(block):
+        a += x
+        b += (n - k) * x
+    return a & 0xFFFF, b & 0xFFFF
 
-    print(f"已生成 {output}，包含 {n_files} 个文件，总字节数 {cur}（不含额外元数据）。")
+
+def delta_ops(base: bytes, target: bytes, block: int = DELTA_BLOCK_SIZE) -> List[Tuple[int, int, int]]:
+    """用滚动哈希块匹配计算 target 相对 base 的差分指令。
+
+    返回 (DELTA_OP_COPY, base偏移, 长度) 或 (DELTA_OP_INSERT, target偏移, 长度) 列表，
+    base 按块建索引，target 逐字节滚动查找，整体与两者长度成线性关系。
+    """
+    n = len(target)
+    ops: List[Tuple[int, int, int]] = []
+    if n < block or len(base) < block:
+        if n:
+            ops.append((DELTA_OP_INSERT, 0, n))
+        return ops
+
+    index: Dict[int, List[int]] = {}
+    for off in range(0, len(base) - block + 1, block):
+        a, b = weak_checksum(base[off:off + block])
+        index.setdefault((b << 16) | a, []).append(off)
+
+    lit_start = 0
+    i = 0
+    a, b = weak_checksum(target[0:block])
+    while i + block <= n:
+        match = -1
+        cands = index.get((b << 16) | a)
+        if cands:
+            window = target[i:i + block]
+            for off in cands:
+                if base[off:off + block] == window:
+                    match = off
+                    break
+
+        if match < 0:
+            if i + block < n:
+                out = target[i]
+                a = (a - out + target[i + block]) & 0xFFFF
+                b = (b - block * out + a) & 0xFFFF
+            i += 1
+            continue
+
+        # 向后扩展进尚未输出的字面量区域
+        while i > lit_start and match > 0 and target[i - 1] == base[match - 1]:
+            i -= 1
+            match -= 1
+        # 向前扩展匹配
+        j = i + block
+        k = match + block
+        while j < n and k < len(base) and target[j] == base[k]:
+            j += 1
+            k += 1
+
+        if i > lit_start:
+            ops.append((DELTA_OP_INSERT, lit_start, i - lit_start))
+        ops.append((DELTA_OP_COPY, match, j - i))
+        i = j
+        lit_start = j
+        if i + block <= n:
+            a, b = weak_checksum(target[i:i + block])
+
+    if lit_start < n:
+        ops.append((DELTA_OP_INSERT, lit_start, n - lit_start))
+    return ops
+
+
+def make_delta(base_path: str, target_path: str, output: str) -> None:
+    """生成 target 封包相对原始封包 base 的逐条目二进制差分"""
+    payload = bytearray()
+    n_same = 0
+    with GrpArchive(base_path) as base, GrpArchive(target_path) as target:
+        raw = base.raw()
+        base_hash = hash_bytes(raw)
+        raw.release()
+        for i in range(len(target)):
+            t_view = target.entry(i)
+            t_data = bytes(t_view)
+            t_view.release()
+            b_data = b''
+            if i < len(base):
+                b_view = base.entry(i)
+                b_data = bytes(b_view)
+                b_view.release()
+            if i < len(base) and b_data == t_data:
+                payload.append(DELTA_ENTRY_SAME)
+                n_same += 1
+                continue
+
+            ops = delta_ops(b_data, t_data)
+            payload.append(DELTA_ENTRY_PATCH)
+            write_varint(payload, len(t_data))
+            payload += bytes.fromhex(hash_bytes(t_data))
+            write_varint(payload, len(ops))
+            for kind, off, length in ops:
+                payload.append(kind)
+                if kind == DELTA_OP_COPY:
+                    write_varint(payload, off)
+                    write_varint(payload, length)
+                else:
+                    write_varint(payload, length)
+                    payload += t_data[off:off + length]
+        n_files = len(target)
+
+    with open(output, 'wb') as f:
+        f.write(DELTA_MAGIC)
+        f.write(struct.pack('<B', DELTA_VERSION))
+        f.write(bytes.fromhex(base_hash))
+        f.write(struct.pack('<I', n_files))
+        f.write(zlib.compress(bytes(payload), 9))
+
+    print(f"已生成 {output}，{n_files} 个条目中 {n_same} 个与原封包相同，差分大小 {os.path.getsize(output)} 字节。")
+
+
+def apply_delta(base_path: str, delta_path: str, output: str) -> None:
+    """根据原始封包和差分重建目标封包"""
+    with open(delta_path, 'rb') as f:
+        blob = f.read()
+    if blob[:4] != DELTA_MAGIC:
+        raise ValueError(f"{delta_path} 不是差分文件")
+    if blob[4] != DELTA_VERSION:
+        raise ValueError(f"不支持的差分版本: {blob[4]}")
+    base_hash = blob[5:21].hex()
+    n_files = struct.unpack_from('<I', blob, 21)[0]
+    payload = zlib.decompress(blob[25:])
+
+    entries: List[bytes] = []
+    with GrpArchive(base_path) as base:
+        raw = base.raw()
+        actual_hash = hash_bytes(raw)
+        raw.release()
+        if actual_hash != base_hash:
+            raise ValueError(f"{base_path} 与生成差分时使用的原始封包不一致")
+
+        pos = 0
+        for i in range(n_files):
+            kind = payload[pos]
+            pos += 1
+            b_data = b''
+            if i < len(base):
+                b_view = base.entry(i)
+                b_data = bytes(b_view)
+                b_view.release()
+            if kind == DELTA_ENTRY_SAME:
+                entries.append(b_data)
+                continue
+
+            size, pos = read_varint(payload, pos)
+            expect_hash = payload[pos:pos + 16].hex()
+            pos += 16
+            n_ops, pos = read_varint(payload, pos)
+            out = bytearray()
+            for _ in range(n_ops):
+                op = payload[pos]
+                pos += 1
+                if op == DELTA_OP_COPY:
+                    off, pos = read_varint(payload, pos)
+                    length, pos = read_varint(payload, pos)
+                    out += b_data[off:off + length]
+                else:
+                    length, pos = read_varint(payload, pos)
+                    out += payload[pos:pos + length]
+                    pos += length
+            if len(out) != size or hash_bytes(out) != expect_hash:
+                raise ValueError(f"第 {i+1} 个条目还原后校验失败")
+            entries.append(bytes(out))
+
+    offsets = pack_entries([(str(i), e) for i, e in enumerate(entries)], output)
+    print(f"已生成 {output}，包含 {n_files} 个文件，总字节数 {offsets[-1]}。")
 
 
 def main():
@@ -158,16 +1041,70 @@ def main():
         description="packer 解包/打包工具")
     sub = ap.add_subparsers(dest='cmd', required=True)
     ap_unpack = sub.add_parser('unpack', help='解包')
-    ap_unpack.add_argument('-i', '--input', required=True, help='输入')
-    ap_unpack.add_argument('-o', '--out', required=True, help='输出')
+    ap_unpack.add_argument('-i', '--input', required=True,
+                           action='append', help='输入，可与 -o 成对重复指定')
+    ap_unpack.add_argument('-o', '--out', required=True,
+                           action='append', help='输出')
+    ap_unpack.add_argument('-j', '--jobs', type=int, default=None,
+                           help='并发写出的线程数，0 表示 CPU 数，指定后只打印汇总；'
+                                '默认单个输入时串行，多个输入时为 8')
     ap_pack = sub.add_parser('pack', help='打包')
     ap_pack.add_argument('-i', '--input', required=True, help='输入')
     ap_pack.add_argument('-o', '--out', required=True, help='输出')
+    ap_pack.add_argument('--zero-copy', action='store_true',
+                         help='预分配输出并用 copy_file_range/sendfile 复制条目')
+    ap_pack.add_argument('--incremental', action='store_true',
+                         help=f'根据输出旁的 {INCREMENTAL_SUFFIX} 清单复用旧封包中未变化的条目')
+    ap_pack.add_argument('--manifest', default=None,
+                         help='--incremental 使用的清单路径（默认为输出旁）')
+    ap_check = sub.add_parser('check', help='校验封包的偏移表')
+    ap_check.add_argument('-i', '--input', required=True, help='输入封包')
+    ap_manifest = sub.add_parser('manifest', help='生成封包旁的条目清单')
+    ap_manifest.add_argument('-i', '--input', required=True, help='输入封包')
+    ap_verify = sub.add_parser('verify', help='校验封包与源目录/封包是否一致')
+    ap_verify.add_argument('-i', '--input', required=True, help='输入封包')
+    ap_verify.add_argument('-s', '--source', required=True,
+                           help='源目录或用于对照的封包')
+    ap_diff = sub.add_parser('diff', help='逐条目比较两个封包')
+    ap_diff.add_argument('a', help='封包 A')
+    ap_diff.add_argument('b', help='封包 B')
+    ap_delta = sub.add_parser('delta', help='生成相对原始封包的二进制差分')
+    ap_delta.add_argument('-b', '--base', required=True, help='原始封包')
+    ap_delta.add_argument('-t', '--target', required=True, help='目标封包')
+    ap_delta.add_argument('-o', '--out', required=True, help='输出差分文件')
+    ap_apply = sub.add_parser('apply', help='用原始封包和差分重建目标封包')
+    ap_apply.add_argument('-b', '--base', required=True, help='原始封包')
+    ap_apply.add_argument('-d', '--delta', required=True, help='差分文件')
+    ap_apply.add_argument('-o', '--out', required=True, help='输出封包')
     args = ap.parse_args()
     if args.cmd == 'unpack':
-        unpack(args.input, args.out)
+        if len(args.input) != len(args.out):
+            ap.error("-i 与 -o 的数量必须一致")
+        if args.jobs is None and len(args.input) == 1:
+            unpack(args.input[0], args.out[0])
+        else:
+            workers = 8 if args.jobs is None else (args.jobs if args.jobs > 0 else (os.cpu_count() or 1))
+            unpack_parallel(list(zip(args.input, args.out)), workers)
     elif args.cmd == 'pack':
-        pack(args.input, args.out)
+        if args.incremental:
+            pack_incremental(args.input, args.out, args.manifest)
+        else:
+            pack(args.input, args.out, args.zero_copy)
+    elif args.cmd == 'check':
+        if not check(args.input):
+            sys.exit(1)
+    elif args.cmd == 'manifest':
+        write_manifest(args.input)
+    elif args.cmd == 'verify':
+        if not verify(args.input, args.source):
+            sys.exit(1)
+    elif args.cmd == 'diff':
+        if diff(args.a, args.b):
+            sys.exit(1)
+    elif args.cmd == 'delta':
+        make_delta(args.base, args.target, args.out)
+    elif args.cmd == 'apply':
+        apply_delta(args.base, args.delta, args.out)
 
 
 if __name__ == '__main__':
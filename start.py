@@ -56,23 +56,31 @@ features = [
 PACKER = "python packer.py"
 ASMER = "python ops.py"
 
+# 为 True 时额外写出 asmed/ 和 raw/ 等中间目录，便于调试
+# 否则提取/替换直接从 Event.grp 在内存中反汇编
+DEBUG_DUMP = False
+
+# Event001 不是脚本，原样放在 asmed_pass 中
+ER_ARGS = "--path Event.grp --exclude Event001" + \
+    (" --dump-dir raw" if DEBUG_DUMP else "")
+
 ER = [
-    ("python er.py extract --path raw --output raw.json",
-     "python er.py replace --path raw --text generated/translated.json")
+    (f"python er.py extract {ER_ARGS} --output raw.json",
+     f"python er.py replace {ER_ARGS} --text generated/translated.json")
 ]
 
 
 def extract():
     print("执行提取...")
-    translate_lib.system(
-        f"{PACKER} unpack -i Event.grp -o asmed")
-    translate_lib.rename_file(
-        "asmed/Event001", "../asmed_pass/Event001", overwrite=True)
-    translate_lib.system(
-        f"{PACKER} unpack -i System.grp -o system")
+    if DEBUG_DUMP:
+        translate_lib.system(
+            f"{PACKER} unpack -i Event.grp -o asmed -i System.grp -o system")
+        translate_lib.rename_file(
+            "asmed/Event001", "../asmed_pass/Event001", overwrite=True)
+    else:
+        translate_lib.system(
+            f"{PACKER} unpack -i System.grp -o system -j 8")
 
-    translate_lib.system(
-        f"{ASMER} disasm asmed raw")
     translate_lib.extract_and_concat(ER)
     translate_lib.json_process('e', 'raw.json')
 
@@ -100,14 +108,17 @@ def replace():
     translate_lib.copy_path(
         "translated", "generated/translated", overwrite=True)
 
+    # 只有文本 OP 会变化，以原始 Event.grp 为底稿只重新编码文本
     translate_lib.system(
-        f"{ASMER} asm generated/translated generated/asmed")
+        f"{ASMER} patch generated/translated generated/asmed --base Event.grp --incremental")
 
     translate_lib.merge_directories(
         "asmed_pass", "generated/asmed", overwrite=True)
 
+    # 增量清单放在 generated/cache，generated/dist 会被原样复制到游戏目录
     translate_lib.system(
-        f"{PACKER} pack -i generated/asmed -o generated/dist/MOZU_chs.pak")
+        f"{PACKER} pack -i generated/asmed -o generated/dist/MOZU_chs.pak --incremental"
+        " --manifest generated/cache/MOZU_chs.pak.incremental.json")
 
     translate_lib.copy_path(
         "assets/raw_text", "generated/raw_text", overwrite=True)
@@ -0,0 +1,27 @@
+from utils_tools.libs.ops_lib import OpcodeTable, flat, h, parse_data, string, u16
+
+
+# 01: 文本，02: 跳转到文件内 offset
+OPCODES_MAP = flat({
+    h("01"): [string],
+    h("02"): [u16],
+})
+RELOCATIONS = {"02": [0]}
+
+
+def test_text_growth_relocates_jumps_and_eof():
+    table = OpcodeTable(OPCODES_MAP)
+    # 0: 02 -> 6 | 3: 01 "a" | 6: 02 -> 9 (文件末尾)
+    data = h("02 06 00 01 61 00 02 09 00")
+    opcodes, offset = parse_data({"file_name": "<test>", "offset": 0}, data, table)
+    assert offset == len(data)
+
+    opcodes[1]["value"][0] = "abcd"
+    expected = h("02 09 00 01 61 62 63 64 00 02 0C 00")
+
+    blob = table.assemble(opcodes, None, 1, RELOCATIONS, "<test>", len(data))
+    assert bytes(blob) == expected
+
+    opcodes, _ = parse_data({"file_name": "<test>", "offset": 0}, data, table)
+    opcodes[1]["value"][0] = "abcd"
+    assert table.splice(data, opcodes, ("01",), None, 1, RELOCATIONS, "<test>") == expected
@@ -1,7 +1,141 @@
 #!/usr/bin/env python3
 
-from typing import Any, Callable, Dict, List, Literal, Tuple, Union
-from utils_tools.libs.translate_lib import bytes_to_hex_string, de, read_bytes_s, read_i16_s, read_i32_s, read_i8_s, read_str_s, read_u16_s, read_u32_s, read_u8_s, se, str_to_bytes
+import hashlib
+import json
+import marshal
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
+from utils_tools.libs.translate_lib import bytes_to_hex_string, de, read_bytes, read_i16, read_i32, read_i8, read_str_s, read_u16, read_u32, read_u8, se, str_to_bytes
+
+
+# ==========================================
+# 类型化的参数值
+# ==========================================
+
+# 定长整数类型 -> (最小值, 最大值, 字节数, 是否有符号)
+INT_KINDS = {
+    "u8": (0, 0xFF, 1, False),
+    "u16": (0, 0xFFFF, 2, False),
+    "u32": (0, 0xFFFFFFFF, 4, False),
+    "i8": (-0x80, 0x7F, 1, True),
+    "i16": (-0x8000, 0x7FFF, 2, True),
+    "i32": (-0x80000000, 0x7FFFFFFF, 4, True),
+}
+
+
+class Value:
+    """
+    OP 参数在内存中的表示：kind 为 INT_KINDS 中的整数类型或 "bytes"，val 为 int/bytes。
+    文本参数仍直接使用 str。只在写 JSON 时才转换为 se() 的字符串形式（如 "u16:115"）。
+    实例不可变，可以在多个 OP 之间共享。
+    """
+    __slots__ = ("kind", "val")
+
+    def __init__(self, kind: str, val: Union[int, bytes]):
+        if kind in INT_KINDS:
+            lo, hi = INT_KINDS[kind][:2]
+            if not (isinstance(val, int) and lo <= val <= hi):
+                raise ValueError(f"{kind}值超出范围: {val}")
+        elif kind == "bytes":
+            val = bytes(val)
+        else:
+            raise ValueError(f"未知类型: {kind}")
+        object.__setattr__(self, "kind", kind)
+        object.__setattr__(self, "val", val)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Value 不可修改")
+
+    def __str__(self) -> str:
+        return se(self.val, self.kind)
+
+    def __repr__(self) -> str:
+        return f"Value({self.kind!r}, {self.val!r})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Value) and self.kind == other.kind and self.val == other.val
+
+    def __hash__(self) -> int:
+        return hash((self.kind, self.val))
+
+    def to_bytes(self, byteorder: Literal["little", "big"] = "little") -> bytes:
+        if self.kind == "bytes":
+            return self.val  # type: ignore
+        size, signed = INT_KINDS[self.kind][2:]
+        return self.val.to_bytes(size, byteorder, signed=signed)  # type: ignore
+
+
+_set_kind = Value.kind.__set__  # type: ignore
+_set_val = Value.val.__set__  # type: ignore
+_new_value = object.__new__
+
+
+def make_value(kind: str, val: Union[int, bytes]) -> Value:
+    """不做范围检查地构造 Value，仅供解码路径使用（值来自 struct 解包，范围天然正确）"""
+    value = _new_value(Value)
+    _set_kind(value, kind)
+    _set_val(value, val)
+    return value
+
+
+# 反序列化缓存：整数参数的取值范围很小，相同字符串只解析一次
+_PARSED_VALUES: Dict[str, Value] = {}
+
+
+def parse_value(item: Any) -> Any:
+    """把 JSON 中的字符串参数转换为 Value，文本保持为 str"""
+    if not isinstance(item, str):
+        return item
+    value = _PARSED_VALUES.get(item)
+    if value is not None:
+        return value
+    val, kind = de(item)
+    if kind == "str":
+        return item
+    value = Value(kind, val)
+    if len(_PARSED_VALUES) < 1 << 16:
+        _PARSED_VALUES[item] = value
+    return value
+
+
+def load_values(opcodes: List[Dict]) -> List[Dict]:
+    """原地把从 JSON 读入的 opcodes 的参数转换为类型化的值"""
+    for op in opcodes:
+        op["value"] = [parse_value(x) for x in op.get("value", [])]
+    return opcodes
+
+
+def json_default(obj: Any) -> Any:
+    """json.dump 的 default 回调，把 Value 序列化为 se() 的字符串形式，OpStream/OpView 还原为字典"""
+    if isinstance(obj, Value):
+        return str(obj)
+    if isinstance(obj, OpStream):
+        return obj.to_opcodes()
+    if isinstance(obj, OpView):
+        return obj.to_dict()
+    raise TypeError(f"无法序列化 {type(obj).__name__}")
+
+
+def value_to_bytes(item: Any, byteorder: Literal["little", "big"] = "little", str_encoding=None) -> bytes:
+    """编码单个参数：Value 直接转换，字符串按 str_to_bytes 处理"""
+    if isinstance(item, Value):
+        return item.to_bytes(byteorder)
+    return str_to_bytes(item, byteorder, str_encoding)
+
+
+def int_value(item: Any) -> int:
+    """取整数参数的值，兼容 Value 和 "u8:1" 形式的字符串"""
+    if isinstance(item, Value):
+        return item.val  # type: ignore
+    val, kind = de(item)
+    if kind not in INT_KINDS:
+        raise ValueError(f"不是整数参数: {item}")
+    return val
 
 
 # ==========================================
@@ -10,14 +144,21 @@ from utils_tools.libs.translate_lib import bytes_to_hex_string, de, read_bytes_s
 
 
 class Handler:
-    def __init__(self, func):
+    """
+    kind 不为 None 时表示定长整数处理器（如 "u8"），count 为其重复次数，
+    代码生成时据此把相邻的定长字段合并为一个 struct.Struct
+    """
+
+    def __init__(self, func, kind: Optional[str] = None, count: int = 1):
         self.func = func
+        self.kind = kind
+        self.count = count
 
     def __call__(self, data, offset, ctx):
         return self.func(data, offset, ctx)
 
     def repeat(self, count):
-        return Handler(repeat_handler(self.func, count))
+        return Handler(repeat_handler(self.func, count), self.kind, self.count * count)
 
     def repeat_var(self, var_index=-1):
         return Handler(repeat_var_handler(self.func, var_index))
@@ -49,9 +190,8 @@ def repeat_var_handler(handler: Callable, var_index: int = -1) -> Callable:
     def wrapped_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[List[Any], int]:
         # 从上下文中获取重复次数
         count_value = ctx["value"][var_index]
-        # 如果值形如 "u32:5"，提取数字部分
-        if isinstance(count_value, str) and ":" in count_value:
-            count = int(count_value.split(":", 1)[1])
+        if isinstance(count_value, Value) and count_value.kind in INT_KINDS:
+            count = count_value.val
         else:
             raise ValueError(f"非法的 count_value: {count_value}")
 
@@ -78,28 +218,34 @@ def args_handler(handler: Callable, *handler_args) -> Callable:
 # ==========================================
 
 
-def u8_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
-    return read_u8_s(data, offset)
+def u8_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[Value, int]:
+    val, offset = read_u8(data, offset)
+    return Value("u8", val), offset
 
 
-def u16_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
-    return read_u16_s(data, offset)
+def u16_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[Value, int]:
+    val, offset = read_u16(data, offset)
+    return Value("u16", val), offset
 
 
-def u32_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
-    return read_u32_s(data, offset)
+def u32_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[Value, int]:
+    val, offset = read_u32(data, offset)
+    return Value("u32", val), offset
 
 
-def i8_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
-    return read_i8_s(data, offset)
+def i8_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[Value, int]:
+    val, offset = read_i8(data, offset)
+    return Value("i8", val), offset
 
 
-def i16_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
-    return read_i16_s(data, offset)
+def i16_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[Value, int]:
+    val, offset = read_i16(data, offset)
+    return Value("i16", val), offset
 
 
-def i32_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
-    return read_i32_s(data, offset)
+def i32_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[Value, int]:
+    val, offset = read_i32(data, offset)
+    return Value("i32", val), offset
 
 
 def string_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
@@ -112,7 +258,8 @@ def string_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
 
 
 class EndParsing(Exception):
-    pass
+    # 生成的解码函数会把抛出时的偏移记录在 offset 上
+    offset: Optional[int] = None
 
 
 def end_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
@@ -124,8 +271,9 @@ def end_handler(data: bytes, offset: int, ctx: Dict) -> Tuple[str, int]:
 # ==========================================
 
 
-def byte_slice_handler(data: bytes, offset: int, ctx: Dict, length: int) -> Tuple[str, int]:
-    return read_bytes_s(data, offset, length)
+def byte_slice_handler(data: bytes, offset: int, ctx: Dict, length: int) -> Tuple[Value, int]:
+    val, offset = read_bytes(data, offset, length)
+    return Value("bytes", val), offset
 
 
 # ==========================================
@@ -133,82 +281,939 @@ def byte_slice_handler(data: bytes, offset: int, ctx: Dict, length: int) -> Tupl
 # ==========================================
 
 
-u8 = Handler(u8_handler)
-u16 = Handler(u16_handler)
-u32 = Handler(u32_handler)
-i8 = Handler(i8_handler)
-i16 = Handler(i16_handler)
-i32 = Handler(i32_handler)
+u8 = Handler(u8_handler, "u8")
+u16 = Handler(u16_handler, "u16")
+u32 = Handler(u32_handler, "u32")
+i8 = Handler(i8_handler, "i8")
+i16 = Handler(i16_handler, "i16")
+i32 = Handler(i32_handler, "i32")
 string = Handler(string_handler)
 byte_slice = Handler(byte_slice_handler)
 end = Handler(end_handler)
 
 
+# ==========================================
+# 解码函数代码生成
+# ==========================================
+
+CODEGEN_VERSION = 2
+
+# 定长整数类型 -> struct 格式字符
+FIXED_FORMATS = {"u8": "B", "u16": "H", "u32": "I",
+                 "i8": "b", "i16": "h", "i32": "i"}
+
+
+def describe_handlers(handlers: List) -> Tuple[List[Tuple], List[Callable]]:
+    """
+    把处理器列表描述为代码生成用的结构:
+    ("fixed", [kind, ...]) 为可合并的定长字段，("call", k) 为调用第 k 个不透明处理器
+    """
+    desc: List[Tuple] = []
+    opaque: List[Callable] = []
+    for handler in handlers:
+        kind = getattr(handler, "kind", None)
+        if kind in FIXED_FORMATS:
+            kinds = [kind] * handler.count
+            if desc and desc[-1][0] == "fixed":
+                desc[-1][1].extend(kinds)
+            else:
+                desc.append(("fixed", kinds))
+        else:
+            desc.append(("call", len(opaque)))
+            opaque.append(handler)
+    return desc, opaque
+
+
+def _format_expr(kind: str, var: str) -> str:
+    # u8/i8 使用预先构造的共享实例
+    if kind == "u8":
+        return f"_U8[{var}]"
+    if kind == "i8":
+        return f"_I8[{var} + 128]"
+    return f'_V("{kind}", {var})'
+
+
+def generate_decoders_source(descs: List[List[Tuple]]) -> str:
+    """为每个签名生成一个解码函数: decoder(data, offset, op) -> 新 offset"""
+    lines = [
+        "# 由 ops_lib.generate_decoders_source 自动生成，请勿手动修改",
+        "import struct",
+        "",
+        '_U8 = tuple(_V("u8", i) for i in range(256))',
+        '_I8 = tuple(_V("i8", i) for i in range(-128, 128))',
+    ]
+    structs: Dict[str, str] = {}
+    funcs: List[str] = []
+    for n, desc in enumerate(descs):
+        body: List[str] = []
+        has_call = False
+        call_base = f"_H{n}"
+        for part in desc:
+            if part[0] == "fixed":
+                kinds = part[1]
+                fmt = "<" + "".join(FIXED_FORMATS[k] for k in kinds)
+                if fmt not in structs:
+                    structs[fmt] = f"_S{len(structs)}"
+                name = structs[fmt]
+                body.append(f"a = {name}.unpack_from(data, off)")
+                body.append(f"off += {struct.calcsize(fmt)}")
+                items = ", ".join(_format_expr(k, f"a[{i}]")
+                                  for i, k in enumerate(kinds))
+                body.append(f"v += ({items},)")
+            else:
+                has_call = True
+                body.append(f"r, off = {call_base}[{part[1]}](data, off, op)")
+                body.append("if r is not None:")
+                body.append("    if isinstance(r, list):")
+                body.append("        v.extend(r)")
+                body.append("    else:")
+                body.append("        v.append(r)")
+
+        func = [f"def _d{n}(data, off, op):"]
+        if body:
+            func.append('    v = op["value"]')
+        if has_call:
+            func.append("    try:")
+            func.extend("        " + line for line in body)
+            func.append("    except EndParsing as e:")
+            func.append("        e.offset = off")
+            func.append("        raise")
+        else:
+            func.extend("    " + line for line in body)
+        func.append("    return off")
+        funcs.append("\n".join(func))
+
+    for fmt, name in structs.items():
+        lines.append(f'{name} = struct.Struct("{fmt}")')
+    lines.append("")
+    lines.extend(f + "\n" for f in funcs)
+    lines.append("DECODERS = (" + "".join(f"_d{n}, " for n in range(len(descs))) + ")")
+    return "\n".join(lines) + "\n"
+
+
+def generate_encoders_source(signatures: List[bytes], descs: List[List[Tuple]]) -> str:
+    """
+    为每个签名生成编码函数 encoder(values, str_encoding) -> bytes 和精确大小，
+    是 generate_decoders_source 的镜像。
+    只有定长字段的 OP 直接用预编译的 struct 打包，大小为常量；
+    含不透明处理器（如文本）的 OP 使用预先算好的 op 字节加通用的逐值编码，大小为 None。
+    值的类型与 spec 不符时退回通用编码，保持与 assemble_one_op 相同的行为。
+
+    定长 OP 另外生成 args(values) -> 参数元组（类型/范围不符时抛出异常）
+    和 writer(buf, offset, args) -> 新 offset，供预分配缓冲区的两遍汇编使用。
+    """
+    lines = [
+        "# 由 ops_lib.generate_encoders_source 自动生成，请勿手动修改",
+        "import struct",
+        "",
+        "",
+        "def _int(x, kind):",
+        "    # Value 构造时已检查过范围，这里只需确认类型",
+        "    if x.__class__ is not _Value or x.kind != kind:",
+        "        raise ValueError(x)",
+        "    return x.val",
+        "",
+    ]
+    structs: Dict[str, str] = {}
+    funcs: List[str] = []
+    sizes: List[str] = []
+    args_names: List[str] = []
+    writer_names: List[str] = []
+    for n, (signature, desc) in enumerate(zip(signatures, descs)):
+        sig_len = len(signature)
+        lines.append(f'_P{n} = bytes.fromhex("{signature.hex()}")')
+        if any(part[0] == "call" for part in desc):
+            funcs.append("\n".join([
+                f"def _e{n}(v, enc):",
+                f"    return _generic(_P{n}, v, enc)",
+            ]))
+            sizes.append("None")
+            args_names.append("None")
+            writer_names.append("None")
+            continue
+
+        kinds = [k for part in desc for k in part[1]]
+        args_names.append(f"_a{n}")
+        writer_names.append(f"_w{n}")
+        if not kinds:
+            funcs.append("\n".join([
+                f"def _e{n}(v, enc):",
+                "    if v:",
+                f"        return _generic(_P{n}, v, enc)",
+                f"    return _P{n}",
+                "",
+                f"def _a{n}(v):",
+                "    if v:",
+                "        raise ValueError(v)",
+                "    return ()",
+                "",
+                f"def _w{n}(buf, off, a):",
+                f"    buf[off:off + {sig_len}] = _P{n}",
+                f"    return off + {sig_len}",
+            ]))
+            sizes.append(str(sig_len))
+            continue
+
+        fmt = "<" + "".join(FIXED_FORMATS[k] for k in kinds)
+        if fmt not in structs:
+            structs[fmt] = f"_S{len(structs)}"
+        size = sig_len + struct.calcsize(fmt)
+        names = [f"x{i}" for i in range(len(kinds))]
+        conv = [f'_int({x}, "{k}")' for x, k in zip(names, kinds)]
+        funcs.append("\n".join([
+            f"def _e{n}(v, enc):",
+            "    try:",
+            f"        return _P{n} + {structs[fmt]}.pack(*_a{n}(v))",
+            "    except (KeyError, ValueError, TypeError):",
+            f"        return _generic(_P{n}, v, enc)",
+            "",
+            f"def _a{n}(v):",
+            f"    {', '.join(names)}, = v",
+            f"    return ({', '.join(conv)},)",
+            "",
+            f"def _w{n}(buf, off, a):",
+            f"    buf[off:off + {sig_len}] = _P{n}",
+            f"    {structs[fmt]}.pack_into(buf, off + {sig_len}, *a)",
+            f"    return off + {size}",
+        ]))
+        sizes.append(str(size))
+
+    for fmt, name in structs.items():
+        lines.append(f'{name} = struct.Struct("{fmt}")')
+    lines.append("")
+    lines.extend(f + "\n" for f in funcs)
+    lines.append("ENCODERS = (" + "".join(f"_e{n}, " for n in range(len(descs))) + ")")
+    lines.append("SIZES = (" + "".join(f"{x}, " for x in sizes) + ")")
+    lines.append("ARGS = (" + "".join(f"{x}, " for x in args_names) + ")")
+    lines.append("WRITERS = (" + "".join(f"{x}, " for x in writer_names) + ")")
+    return "\n".join(lines) + "\n"
+
+
+def generic_encode(op_bytes: bytes, values: List, str_encoding=None) -> bytes:
+    """逐值编码参数，语义与 assemble_one_op 相同"""
+    out = bytearray(op_bytes)
+    for item in values:
+        out += value_to_bytes(item, 'little', str_encoding)
+    return bytes(out)
+
+
+# 每个前缀保留的缓存条目数。disasm 和 asm 分别使用原版和替换后的码表，同一次运行会用到两份
+CACHE_KEEP = 4
+
+
+def prune_cache(cache_dir: str, prefix: str, suffix: str, keep: int = CACHE_KEEP):
+    """
+    删除 cache_dir 中 "{prefix}_<16位哈希>{suffix}" 形式的旧条目，按修改时间只保留最近的 keep 个。
+    删除失败（被其他进程抢先删除等）时忽略
+    """
+    entries = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                name = entry.name
+                key = name[len(prefix) + 1:-len(suffix)]
+                if name.startswith(prefix + "_") and name.endswith(suffix) and len(key) == 16 \
+                        and all(c in "0123456789abcdef" for c in key):
+                    entries.append((entry.stat().st_mtime_ns, entry.path))
+    except OSError:
+        return
+    entries.sort(reverse=True)
+    for _, path in entries[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def touch(path: str):
+    """命中缓存时更新修改时间，prune_cache 据此保留最近使用的条目"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def load_cached(cache_dir: Optional[str], prefix: str, source: bytes, build: Callable[[], Any]) -> Any:
+    """
+    以 source 的哈希为键，把 build() 的结果（需可 marshal）缓存在 cache_dir 中。
+    marshal 的格式随 Python 版本变化，键中包含解释器版本；cache_dir 为空时直接 build()。
+    写入新条目后按 prune_cache 清理同一前缀的旧条目。
+    写缓存失败（目录不可写等）时忽略，照常返回 build() 的结果
+    """
+    if not cache_dir:
+        return build()
+    tag = f"{sys.implementation.cache_tag}:{CODEGEN_VERSION}".encode("utf-8")
+    key = hashlib.blake2b(tag + source, digest_size=8).hexdigest()
+    path = os.path.join(cache_dir, f"{prefix}_{key}.marshal")
+    try:
+        with open(path, "rb") as f:
+            value = marshal.load(f)
+        touch(path)
+        return value
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    value = build()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp, "wb") as f:
+            marshal.dump(value, f)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    else:
+        prune_cache(cache_dir, prefix, ".marshal")
+    return value
+
+
+def load_generated_module(source: str, namespace: Dict, cache_dir: Optional[str], prefix: str) -> Dict:
+    """
+    执行生成的代码。指定 cache_dir 时源码按内容哈希写到磁盘上（便于查看和报错定位），
+    编译后的代码对象用 marshal 缓存，opcodes map 结构不变时跳过 compile。
+    写缓存只是尽力而为，目录不可写时直接在内存中编译
+    """
+    key = hashlib.blake2b(source.encode("utf-8"), digest_size=8).hexdigest()
+    filename = f"<{prefix}_{key}>"
+    if cache_dir:
+        path = os.path.join(cache_dir, f"{prefix}_{key}.py")
+        try:
+            if os.path.isfile(path):
+                touch(path)
+            else:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(source)
+                os.replace(tmp, path)
+                prune_cache(cache_dir, prefix, ".py")
+            filename = path
+        except OSError:
+            pass
+    code = load_cached(cache_dir, prefix, source.encode("utf-8"),
+                       lambda: compile(source, filename, "exec"))
+    exec(code, namespace)
+    return namespace
+
+
+# ==========================================
+# 统计
+# ==========================================
+
+
+class OpStats:
+    """
+    按 OP 统计解码/编码的次数、消耗/产出的字节数和处理函数的累计耗时。
+    赋值给 OpcodeTable.stats 后生效，为 None（默认）时解析和汇编路径上没有额外开销。
+    """
+
+    FIELDS = ("decode_count", "bytes_in", "decode_ns",
+              "encode_count", "bytes_out", "encode_ns")
+
+    def __init__(self):
+        # op -> [解码次数, 消耗字节, 解码耗时ns, 编码次数, 产出字节, 编码耗时ns]
+        self.records: Dict[str, List[int]] = {}
+
+    def _record(self, op_hex: str) -> List[int]:
+        record = self.records.get(op_hex)
+        if record is None:
+            record = self.records[op_hex] = [0] * len(self.FIELDS)
+        return record
+
+    def decode(self, op_hex: str, decoder: Callable, data: bytes, start: int, offset: int, op: Dict) -> int:
+        """计时执行一次解码函数，start 为 OP 起始偏移，offset 为参数起始偏移"""
+        record = self._record(op_hex)
+        t0 = perf_counter_ns()
+        # 解码函数抛出其他异常时不计字节数
+        end = start
+        try:
+            end = decoder(data, offset, op)
+        except EndParsing as e:
+            # 终止解析的 OP 也消耗了字节，同样计入
+            end = e.offset if e.offset is not None else offset
+            raise
+        finally:
+            record[2] += perf_counter_ns() - t0
+            record[0] += 1
+            record[1] += end - start
+        return end
+
+    def add_encode(self, op_hex: str, size: int, ns: int = 0):
+        record = self._record(op_hex)
+        record[3] += 1
+        record[4] += size
+        record[5] += ns
+
+    def merge(self, other: "OpStats"):
+        for op_hex, values in other.records.items():
+            record = self._record(op_hex)
+            for i, v in enumerate(values):
+                record[i] += v
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        return {op_hex: dict(zip(self.FIELDS, values))
+                for op_hex, values in sorted(self.records.items())}
+
+    def dump_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+    def table(self) -> List[str]:
+        """按累计耗时降序排列的文本表格"""
+        lines = [f"{'op':<12}{'解码次数':>10}{'消耗字节':>12}{'解码ms':>10}"
+                 f"{'编码次数':>10}{'产出字节':>12}{'编码ms':>10}{'us/次':>8}"]
+        rows = sorted(self.records.items(),
+                      key=lambda kv: kv[1][2] + kv[1][5], reverse=True)
+        totals = [0] * len(self.FIELDS)
+        for op_hex, r in rows:
+            count = r[0] + r[3]
+            per = (r[2] + r[5]) / count / 1000 if count else 0.0
+            name = op_hex if len(op_hex) <= 11 else op_hex[:8] + "..."
+            lines.append(f"{name:<12}{r[0]:>14}{r[1]:>16}{r[2] / 1e6:>12.2f}"
+                         f"{r[3]:>14}{r[4]:>16}{r[5] / 1e6:>12.2f}{per:>9.2f}")
+            totals = [a + b for a, b in zip(totals, r)]
+        lines.append(f"{'合计':<10}{totals[0]:>14}{totals[1]:>16}{totals[2] / 1e6:>12.2f}"
+                     f"{totals[3]:>14}{totals[4]:>16}{totals[5] / 1e6:>12.2f}")
+        return lines
+
+
+# ==========================================
+# 编译后的 opcode 表
+# ==========================================
+
+
+class OpcodeTable:
+    """
+    由 flat() 后的 opcodes map 编译得到的分派表，只需编译一次
+
+    dispatch[首字节] 为该字节开头的所有 (签名, 处理器列表, 十六进制, 解码函数)，
+    按签名长度降序排列，因此桶内第一个匹配的签名就是最长匹配。
+    解码函数由 generate_decoders_source 为每个签名单独生成。
+    encoders[十六进制] 为 (编码函数, 常量大小, 参数转换函数, 写入函数)，由 generate_encoders_source 生成。
+    signatures[十六进制] 为对应的签名字节。
+    """
+
+    def __init__(self, flatten_opcodes_map: Dict, cache_dir: Optional[str] = None):
+        self.opcodes_map = flatten_opcodes_map
+        signatures = sorted(flatten_opcodes_map.keys(), key=len, reverse=True)
+        for signature in signatures:
+            if not signature:
+                raise ValueError("opcode 签名不能为空")
+
+        descs = []
+        namespace: Dict[str, Any] = {"EndParsing": EndParsing, "_V": make_value}
+        for n, signature in enumerate(signatures):
+            desc, opaque = describe_handlers(
+                flatten_opcodes_map[signature])
+            descs.append(desc)
+            namespace[f"_H{n}"] = opaque
+        decoders_source = generate_decoders_source(descs)
+        encoders_source = generate_encoders_source(signatures, descs)
+        # 生成的代码完整描述了签名和参数布局，作为这张表的指纹（用于缓存键）
+        self.fingerprint = hashlib.blake2b(
+            f"{CODEGEN_VERSION}\n{decoders_source}\n{encoders_source}".encode("utf-8"), digest_size=16).hexdigest()
+        decoders = load_generated_module(
+            decoders_source, namespace, cache_dir, "ops_decoders")["DECODERS"]
+        generated = load_generated_module(
+            encoders_source, {"_generic": generic_encode, "_Value": Value}, cache_dir, "ops_encoders")
+        # 十六进制 -> (编码函数, 常量大小或None, 参数转换函数或None, 写入函数或None)
+        self.encoders: Dict[str, Tuple[Callable, Optional[int], Optional[Callable], Optional[Callable]]] = {
+            bytes_to_hex_string(signature): spec
+            for signature, *spec in zip(signatures, generated["ENCODERS"], generated["SIZES"], generated["ARGS"], generated["WRITERS"])
+        }
+        # 赋值为 OpStats 时记录每个 OP 的统计信息
+        self.stats: Optional[OpStats] = None
+        self.signatures: Dict[str, bytes] = {
+            bytes_to_hex_string(signature): signature for signature in signatures}
+
+        buckets: List[List[Tuple[bytes, List, str, Callable]]] = [[]
+                                                                  for _ in range(256)]
+        for signature, decoder in zip(signatures, decoders):
+            buckets[signature[0]].append(
+                (signature, flatten_opcodes_map[signature], bytes_to_hex_string(signature), decoder))
+        self.dispatch: List[Tuple[Tuple[bytes, List, str, Callable], ...]] = [
+            tuple(b) for b in buckets]
+
+    def encode(self, op_entry: Dict, str_encoding=None) -> bytes:
+        """编码一条 OP，未知的 op 退回 assemble_one_op"""
+        spec = self.encoders.get(op_entry["op"])
+        if spec is None:
+            return assemble_one_op(op_entry, str_encoding=str_encoding)
+        return spec[0](op_entry.get("value", []), str_encoding)
+
+    def _plan_op(self, op: Dict, str_encoding=None) -> Tuple[Optional[Callable], Any, int]:
+        """返回 (写入函数, 参数元组, 大小)；不是定长 OP 或参数不符时为 (None, 编码结果, 大小)"""
+        if self.stats is None:
+            return self._plan_op_untimed(op, str_encoding)
+        t0 = perf_counter_ns()
+        item = self._plan_op_untimed(op, str_encoding)
+        self.stats.add_encode(op["op"], item[2], perf_counter_ns() - t0)
+        return item
+
+    def _plan_op_untimed(self, op: Dict, str_encoding=None) -> Tuple[Optional[Callable], Any, int]:
+        spec = self.encoders.get(op["op"])
+        if spec is not None and spec[2] is not None:
+            try:
+                return spec[3], spec[2](op.get("value", [])), spec[1]
+            except (KeyError, ValueError, TypeError):
+                pass
+        blob = self.encode(op, str_encoding)
+        return None, blob, len(blob)
+
+    def assemble(self, opcodes: List[Dict], str_encoding=None, align: int = 1,
+                 relocations: Optional[Dict] = None, file: str = "", size: Optional[int] = None) -> bytearray:
+        """
+        两遍汇编整个文件：
+        第一遍确定每条 OP 的大小（定长 OP 只做参数转换，其余 OP 编码一次并暂存），
+        然后一次性分配包含 align 对齐填充的缓冲区，第二遍把每条 OP 写到自己的偏移处。
+        relocations 为 {op: 参数下标列表或回调}，第一遍之后按新的大小重定位这些参数（见 relocate）。
+        size 为原文件大小，指向原文件末尾的偏移被重定位到新的总长度。
+        """
+        plan: List[Tuple[Optional[Callable], Any, int]] = [
+            self._plan_op(op, str_encoding) for op in opcodes]
+
+        if relocations:
+            moved = relocate(file, opcodes, [p[2] for p in plan], relocations, size)
+            for i in moved:
+                item = self._plan_op(opcodes[i], str_encoding)
+                if item[2] != plan[i][2]:
+                    raise ValueError(f"{file}: 重定位改变了第 {i} 条 OP 的大小")
+                plan[i] = item
+
+        total = sum(p[2] for p in plan)
+        # bytearray 以 0 初始化，对齐填充无需另外写入
+        buf = bytearray(total + (-total % align))
+        off = 0
+        for writer, item, size in plan:
+            if writer is not None:
+                off = writer(buf, off, item)
+            else:
+                end = off + size
+                buf[off:end] = item
+                off = end
+        return buf
+
+    def splice(self, data: Union[bytes, memoryview], opcodes: List[Dict], text_ops: Iterable[str],
+               str_encoding=None, align: int = 1, relocations: Optional[Dict] = None, file: str = "") -> bytes:
+        """
+        以原始二进制为底稿拼出新文件：只有 text_ops 中的 OP 重新编码，
+        其余 OP 按记录的 offset 和定长大小直接从 data 中切片复制，相邻的复制合并为一段。
+        opcodes 中缺失的 OP（如合并换行后删掉的文本段）在输出中同样被省略。
+        relocations 中的 OP 在重定位后重新编码，不再原样复制。
+
+        非文本 OP 的参数不会被读取，因此要求它们与原始二进制一致；
+        结果与对同一 opcodes 做 assemble 相同，但不需要对非文本 OP 做参数转换和编码。
+        """
+        text_ops = set(text_ops)
+        encoders = self.encoders
+        encoded: Dict[int, bytes] = {}
+
+        stats = self.stats
+
+        def encode(op: Dict) -> bytes:
+            t0 = perf_counter_ns() if stats is not None else 0
+            if op["op"] not in text_ops:
+                op = dict(op, value=[parse_value(x) for x in op.get("value", [])])
+            blob = self.encode(op, str_encoding)
+            if stats is not None:
+                stats.add_encode(op["op"], len(blob), perf_counter_ns() - t0)
+            return blob
+
+        reencode = text_ops
+        if relocations and any(op["op"] in relocations for op in opcodes):
+            reencode = text_ops | set(relocations)
+            sizes = []
+            for i, op in enumerate(opcodes):
+                spec = encoders.get(op["op"])
+                if op["op"] in text_ops or spec is None or spec[1] is None:
+                    encoded[i] = encode(op)
+                    sizes.append(len(encoded[i]))
+                else:
+                    sizes.append(spec[1])
+            for i in relocate(file, opcodes, sizes, relocations, len(data)):
+                encoded.pop(i, None)
+
+        view = memoryview(data)
+        pieces: List[Union[bytes, memoryview]] = []
+        run_start = run_end = -1
+
+        for i, op in enumerate(opcodes):
+            op_hex = op["op"]
+            spec = encoders.get(op_hex)
+            if op_hex in reencode or spec is None or spec[1] is None:
+                if run_start >= 0:
+                    pieces.append(view[run_start:run_end])
+                    run_start = -1
+                blob = encoded.get(i)
+                pieces.append(blob if blob is not None else encode(op))
+                continue
+
+            start = op["offset"]
+            end = start + spec[1]
+            signature = self.signatures[op_hex]
+            if end > len(view) or view[start:start + len(signature)] != signature:
+                raise ValueError(f"offset {start} 处不是原始的 {op_hex} OP")
+            if stats is not None:
+                # 原样复制的 OP 只记次数和字节数
+                stats.add_encode(op_hex, spec[1])
+            if start == run_end:
+                run_end = end
+            else:
+                if run_start >= 0:
+                    pieces.append(view[run_start:run_end])
+                run_start, run_end = start, end
+        if run_start >= 0:
+            pieces.append(view[run_start:run_end])
+
+        out = b"".join(pieces)
+        pieces.clear()
+        view.release()
+        return out + bytes(-len(out) % align)
+
+
+# id(opcodes map) -> (opcodes map, 编译结果)；同时持有 map 本身，保证 id 不会被复用
+_compiled_tables: Dict[int, Tuple[Dict, OpcodeTable]] = {}
+
+
+def compile_opcodes(opcodes_map: Union[Dict, OpcodeTable], cache_dir: Optional[str] = None) -> OpcodeTable:
+    """
+    编译 opcodes map。同一个 dict 只编译一次，之后直接返回缓存的分派表，
+    因此直接把 dict 传给 parse_data/iter_ops 也不会每次都重新生成解码函数。
+    签名数量变化时视为 dict 已被修改，重新编译
+    """
+    if isinstance(opcodes_map, OpcodeTable):
+        return opcodes_map
+    cached = _compiled_tables.get(id(opcodes_map))
+    if cached is not None and cached[0] is opcodes_map and len(cached[1].signatures) == len(opcodes_map):
+        return cached[1]
+    table = OpcodeTable(opcodes_map, cache_dir)
+    _compiled_tables[id(opcodes_map)] = (opcodes_map, table)
+    return table
+
+
 # ==========================================
 # 解析引擎
 # ==========================================
 
-def parse_data(debug_info: dict, data: bytes, flatten_opcodes_map: Dict) -> Tuple[List[Dict], int]:
-    opcodes = []
+def iter_ops(data: bytes, flatten_opcodes_map: Union[Dict, OpcodeTable], debug_info: Optional[dict] = None) -> Iterator[Dict]:
+    """
+    边解码边逐条产出 OP 字典，消费者可以提前停止，不必等整个文件解析完。
+    生成器结束时的返回值（StopIteration.value）为解析停止处的偏移。
+    """
+    if debug_info is None:
+        debug_info = {"file_name": "<data>", "offset": 0}
     cur_offset = 0
     total_len = len(data)
+    index = 0
 
-    # 按键长度降序排序
-    sorted_keys = sorted(flatten_opcodes_map.keys(), key=len, reverse=True)
+    # 传入的是 dict 时按 dict 缓存编译结果，只在第一次调用时编译
+    table = compile_opcodes(flatten_opcodes_map)
+    dispatch = table.dispatch
+    stats = table.stats
 
     while cur_offset < total_len:
         try:
-            matched = False
+            matched = None
             start_offset = cur_offset
 
-            for signature in sorted_keys:
-                if data.startswith(signature, cur_offset):
-                    # 找到匹配项
-                    handlers = flatten_opcodes_map[signature]
-                    new_offset = cur_offset + len(signature)
-
-                    # 构建 Opcode 对象
-                    op_hex = bytes_to_hex_string(signature)
-                    cur_op = {
-                        "op": op_hex,
-                        "offset": start_offset,
-                        "index": len(opcodes),
-                        "value": []
-                    }
-
-                    # 执行处理链
-                    param_offset = new_offset
-                    try:
-                        for handler in handlers:
-                            res, param_offset = handler(
-                                data, param_offset, cur_op)
-
-                            if res != None:
-                                if isinstance(res, list):
-                                    cur_op['value'].extend(res)
-                                else:
-                                    cur_op['value'].append(res)
-                    except EndParsing:
-                        opcodes.append(cur_op)
-                        return opcodes, param_offset
-
-                    opcodes.append(cur_op)
-                    cur_offset = param_offset
-                    matched = True
+            for entry in dispatch[data[cur_offset]]:
+                if data.startswith(entry[0], cur_offset):
+                    matched = entry
                     break
 
-            if not matched:
+            if matched is None:
                 unknown_byte = data[cur_offset]
                 print(
                     f"{debug_info['file_name']}: 未知 Opcode {hex(unknown_byte)} 在 {hex(cur_offset + debug_info['offset'])}")
                 break
+
+            # 找到匹配项
+            signature, _, op_hex, decoder = matched
+
+            # 构建 Opcode 对象
+            cur_op = {
+                "op": op_hex,
+                "offset": start_offset,
+                "index": index,
+                "value": []
+            }
+
+            # 执行生成的解码函数
+            try:
+                if stats is None:
+                    param_offset = decoder(
+                        data, cur_offset + len(signature), cur_op)
+                else:
+                    param_offset = stats.decode(
+                        op_hex, decoder, data, start_offset, cur_offset + len(signature), cur_op)
+            except EndParsing as e:
+                yield cur_op
+                return e.offset
         except Exception as e:
             op = data[cur_offset]
             print(
                 f"{debug_info['file_name']}: 处理 Opcode {hex(op)} 在 {hex(cur_offset + debug_info['offset'])} 发生错误 {e}")
             break
 
-    return opcodes, cur_offset
+        # 在 try 之外产出，消费者抛出的异常不会被当成解析错误
+        yield cur_op
+        index += 1
+        cur_offset = param_offset
+
+    return cur_offset
+
+
+def parse_data(debug_info: dict, data: bytes, flatten_opcodes_map: Union[Dict, OpcodeTable]) -> Tuple[List[Dict], int]:
+    """一次性解析整个文件，返回 (opcodes, 停止处的偏移)"""
+    opcodes: List[Dict] = []
+    append = opcodes.append
+    ops = iter_ops(data, flatten_opcodes_map, debug_info)
+    try:
+        while True:
+            append(next(ops))
+    except StopIteration as stop:
+        return opcodes, stop.value
+
+
+def parse_stream(debug_info: dict, data: bytes, flatten_opcodes_map: Union[Dict, OpcodeTable]) -> Tuple["OpStream", int]:
+    """与 parse_data 相同，但结果存为紧凑的 OpStream，逐条写入，不保留中间的字典列表"""
+    stream = OpStream(len(data))
+    ops = iter_ops(data, flatten_opcodes_map, debug_info)
+    try:
+        while True:
+            op = next(ops)
+            stream.append(op["op"], op["offset"], op["value"])
+    except StopIteration as stop:
+        return stream, stop.value
+
+# ==========================================
+# 紧凑的 OP 流
+# ==========================================
+
+# 参数类型编码：0 为放在旁表中的对象（文本、字节串等），其余为 INT_KINDS 中的整数类型
+_KIND_CODES = {kind: i + 1 for i, kind in enumerate(INT_KINDS)}
+_CODE_KINDS = (None,) + tuple(INT_KINDS)
+_SHARED_VALUES = {
+    "u8": tuple(make_value("u8", i) for i in range(256)),
+    "i8": tuple(make_value("i8", i) for i in range(-128, 128)),
+}
+
+
+def _decode_param(stream: "OpStream", p: int) -> Any:
+    code = stream.kinds[p]
+    if code == 0:
+        return stream.objects[stream.vals[p]]
+    kind = _CODE_KINDS[code]
+    val = stream.vals[p]
+    if kind == "u8":
+        return _SHARED_VALUES["u8"][val]
+    if kind == "i8":
+        return _SHARED_VALUES["i8"][val + 128]
+    return make_value(kind, val)
+
+
+class OpStream:
+    """
+    一个文件反汇编结果的紧凑表示，代替 {"op", "offset", "index", "value"} 字典的列表。
+
+    op 编号、偏移和每条 OP 的参数起点分别存放在并行的 array 中，
+    整数参数的类型和值存放在 kinds/vals 两个 array 中，文本等其他参数放在旁表 objects 里。
+    通过下标或迭代得到的 OpView 支持 op["op"]、op["value"][0] 这样的字典式访问，
+    所以原来遍历 opcodes 列表的代码可以不做修改。
+    """
+    __slots__ = ("size", "op_names", "op_ids", "ops", "offsets",
+                 "starts", "kinds", "vals", "objects")
+
+    def __init__(self, size: int = 0):
+        self.size = size
+        self.op_names: List[str] = []        # op 编号 -> 十六进制
+        self.op_ids: Dict[str, int] = {}     # 十六进制 -> op 编号
+        self.ops = array("H")
+        self.offsets = array("I")
+        self.starts = array("I", [0])        # 第 i 条 OP 的参数为 [starts[i], starts[i+1])
+        self.kinds = array("B")
+        self.vals = array("q")
+        self.objects: List[Any] = []
+
+    def append(self, op_hex: str, offset: int, values: List[Any]):
+        op_id = self.op_ids.get(op_hex)
+        if op_id is None:
+            op_id = self.op_ids[op_hex] = len(self.op_names)
+            self.op_names.append(op_hex)
+        self.ops.append(op_id)
+        self.offsets.append(offset)
+        for item in values:
+            self._append_param(item)
+        self.starts.append(len(self.kinds))
+
+    def _append_param(self, item: Any):
+        if isinstance(item, Value) and item.kind in _KIND_CODES:
+            self.kinds.append(_KIND_CODES[item.kind])
+            self.vals.append(item.val)  # type: ignore
+        else:
+            # "/E"、"/W" 这类短的控制码尾部大量重复，驻留后只保存一份
+            if type(item) is str and len(item) <= 4:
+                item = sys.intern(item)
+            self.kinds.append(0)
+            self.vals.append(len(self.objects))
+            self.objects.append(item)
+
+    def _set_param(self, p: int, item: Any):
+        if isinstance(item, Value) and item.kind in _KIND_CODES:
+            self.kinds[p] = _KIND_CODES[item.kind]
+            self.vals[p] = item.val  # type: ignore
+        else:
+            # 旧的旁表项不回收，替换次数与文本条数同阶
+            self.kinds[p] = 0
+            self.vals[p] = len(self.objects)
+            self.objects.append(item)
+
+    @classmethod
+    def from_opcodes(cls, opcodes: List[Dict], size: int = 0) -> "OpStream":
+        stream = cls(size)
+        for op in opcodes:
+            stream.append(op["op"], op["offset"], op.get("value", []))
+        return stream
+
+    def to_state(self) -> Tuple:
+        """
+        转换为可以 marshal 的元组（数组存为原始字节），用于缓存解析结果。
+        旁表中的 Value 存为 (kind, val)，其余对象须本身可 marshal
+        """
+        objects = [(item.kind, item.val) if isinstance(item, Value) else item
+                   for item in self.objects]
+        return (self.size, self.op_names, self.ops.tobytes(), self.offsets.tobytes(),
+                self.starts.tobytes(), self.kinds.tobytes(), self.vals.tobytes(), objects)
+
+    @classmethod
+    def from_state(cls, state: Tuple) -> "OpStream":
+        """to_state 的逆操作"""
+        size, op_names, ops, offsets, starts, kinds, vals, objects = state
+        stream = cls(size)
+        stream.op_names = list(op_names)
+        stream.op_ids = {op_hex: i for i, op_hex in enumerate(op_names)}
+        stream.ops.frombytes(ops)
+        stream.offsets.frombytes(offsets)
+        stream.starts = array("I")
+        stream.starts.frombytes(starts)
+        stream.kinds.frombytes(kinds)
+        stream.vals.frombytes(vals)
+        stream.objects = [make_value(*item) if type(item) is tuple else item
+                          for item in objects]
+        return stream
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def __getitem__(self, index: int) -> "OpView":
+        n = len(self.ops)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError(index)
+        return OpView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self.ops)):
+            yield OpView(self, i)
+
+    def values(self, index: int) -> List[Any]:
+        return [_decode_param(self, p) for p in range(self.starts[index], self.starts[index + 1])]
+
+    def to_dict(self, index: int) -> Dict:
+        return {
+            "op": self.op_names[self.ops[index]],
+            "offset": self.offsets[index],
+            "index": index,
+            "value": self.values(index),
+        }
+
+    def to_opcodes(self) -> List[Dict]:
+        """还原为 parse_data 输出的字典列表"""
+        return [self.to_dict(i) for i in range(len(self.ops))]
+
+
+class ValueList:
+    """OpView.value 返回的参数视图，读写都直接作用在 OpStream 上"""
+    __slots__ = ("stream", "start", "end")
+
+    def __init__(self, stream: OpStream, index: int):
+        self.stream = stream
+        self.start = stream.starts[index]
+        self.end = stream.starts[index + 1]
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def _pos(self, i: int) -> int:
+        n = self.end - self.start
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+        return self.start + i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        return _decode_param(self.stream, self._pos(i))
+
+    def __setitem__(self, i: int, item: Any):
+        self.stream._set_param(self._pos(i), item)
+
+    def __iter__(self):
+        for p in range(self.start, self.end):
+            yield _decode_param(self.stream, p)
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class OpView:
+    """OpStream 中一条 OP 的轻量视图，兼容原来的 OP 字典的读写方式"""
+    __slots__ = ("stream", "index")
+
+    KEYS = ("op", "offset", "index", "value")
+
+    def __init__(self, stream: OpStream, index: int):
+        self.stream = stream
+        self.index = index
+
+    @property
+    def op(self) -> str:
+        return self.stream.op_names[self.stream.ops[self.index]]
+
+    @property
+    def offset(self) -> int:
+        return self.stream.offsets[self.index]
+
+    @property
+    def value(self) -> ValueList:
+        return ValueList(self.stream, self.index)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.KEYS else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.KEYS
+
+    def to_dict(self) -> Dict:
+        return self.stream.to_dict(self.index)
+
+    def __repr__(self) -> str:
+        return f"OpView({self.to_dict()!r})"
+
 
 # ==========================================
 # 辅助函数
@@ -257,11 +1262,36 @@ def assemble_one_op(op_entry: Dict, byteorder: Literal["little", "big"] = 'littl
 
     # 2. 参数顺序拼接
     for item in op_entry.get("value", []):
-        out += str_to_bytes(item, byteorder, str_encoding)
+        out += value_to_bytes(item, byteorder, str_encoding)
 
     return bytes(out)
 
 
+def build_offset_map(opcodes: List[Dict], sizes: List[int], size: Optional[int] = None) -> Dict[int, int]:
+    """
+    由每条 OP 汇编后的大小做前缀和，得到 旧 offset -> 新 offset 的映射。
+    size 为原文件大小时额外把文件末尾映射到新的总长度。
+    """
+    new_offsets = accumulate(sizes, initial=0)
+    old2new = {op["offset"]: new for op, new in zip(opcodes, new_offsets)}
+    if size is not None:
+        old2new[size] = sum(sizes)
+    return old2new
+
+
+def relocate(file: str, opcodes: List[Dict], sizes: List[int], relocations: Dict, size: Optional[int] = None) -> List[int]:
+    """
+    按 relocations（{op: 参数下标列表或回调}，与 fix_offset 的 fix_ops_map 相同）
+    把指向文件内 offset 的参数改为新 offset，返回被修改的 OP 的下标。
+    没有需要重定位的 OP 时不建映射表。
+    """
+    moved = [i for i, op in enumerate(opcodes) if op["op"] in relocations]
+    if moved:
+        old2new = build_offset_map(opcodes, sizes, size)
+        fix_offset(file, [opcodes[i] for i in moved], old2new, relocations)
+    return moved
+
+
 def fix_offset(file: str, opcodes: Dict, old2new: Dict[int, int], fix_ops_map: Dict) -> Dict:
     """
     修复操作码中的偏移，将旧偏移映射为新偏移
@@ -280,9 +1310,10 @@ def fix_offset(file: str, opcodes: Dict, old2new: Dict[int, int], fix_ops_map: D
             indices = indices_spec
 
         for i in indices:  # type: ignore
-            old_offset, type_hint = de(op['value'][i])
+            value = parse_value(op['value'][i])
+            old_offset = int_value(value)
             if old_offset not in old2new:
                 raise ValueError(f"{file}, {op} 指向不存在的 offset: {old_offset}")
-            op['value'][i] = se(old2new[old_offset], type_hint)
+            op['value'][i] = Value(value.kind, old2new[old_offset])
 
     return opcodes